@@ -3,14 +3,50 @@
 Docspine aggregation script.
 Reads docs-registry.yaml (repo→services hierarchy), clones each repo once,
 builds each service's docs, copies output to dist/, and writes _build/services.json.
+Clones and the assembled site live in a per-run workspace (workspace.py) until
+the site is swapped into dist/ at the end. Services whose docs and shared
+inputs are unchanged since their last build reuse its output (depgraph.py).
 """
+import argparse
+import filecmp
+import importlib.util
 import json
+import multiprocessing
 import os
+import shlex
 import shutil
 import subprocess
 import sys
+import time
 import yaml
 
+import buildfarm
+import depgraph
+import facets
+import routing
+import servicedb
+import telemetry
+import workspace
+from model import Repo, Service
+
+DIST_DIR = "dist"
+BUILD_DIR = "_build"
+REGISTRY_FILE = "docs-registry.yaml"
+
+# Modules imported once by the forkserver so every in-process build worker
+# starts with the mkdocs toolchain already loaded.
+MKDOCS_PRELOAD = ["mkdocs.config", "mkdocs.commands.build", "material"]
+
+# `mkdocs build` flags the in-process path understands; anything else in a
+# Justfile recipe falls back to running `just docs-build` in a subprocess.
+MKDOCS_BUILD_FLAGS = {
+    "-f": "config_file", "--config-file": "config_file",
+    "-d": "site_dir", "--site-dir": "site_dir",
+    "-s": "strict", "--strict": "strict",
+    "-c": None, "--clean": None,
+    "-q": None, "--quiet": None,
+}
+
 
 def run(cmd, cwd=None):
     print(f"  $ {cmd}")
@@ -30,86 +66,453 @@ def repo_slug(url):
     return name
 
 
-def main():
-    dist_dir = "dist"
-    build_dir = "_build"
-    registry_file = "docs-registry.yaml"
+def clone_repo(url, branch, dest, docs_paths):
+    """Partial-clone a repo and restrict the working tree to its docs paths.
 
-    with open(registry_file) as f:
-        registry = yaml.safe_load(f)
+    Blobs are fetched lazily (--filter=blob:none) and sparse-checkout (cone mode)
+    materialises only the registered docs_path directories plus top-level files,
+    so clone time scales with the docs rather than the whole monorepo.
+    A docs_path of "." builds from the repo root and disables sparse checkout.
+    """
+    if any(p in ("", ".") for p in docs_paths):
+        run(f"git clone --depth=1 --filter=blob:none --branch {branch} {url} {dest}")
+        return False
+    run(f"git clone --depth=1 --filter=blob:none --sparse --branch {branch} {url} {dest}")
+    run("git sparse-checkout set --cone " + " ".join(sorted(set(docs_paths))), cwd=dest)
+    return True
 
-    routing = registry.get("routing", {})
-    group_by = routing.get("group_by", "domain")
-    repos = registry.get("repos", [])
 
-    os.makedirs(dist_dir, exist_ok=True)
-    os.makedirs(build_dir, exist_ok=True)
+def add_sparse_paths(dest, paths):
+    """Extend an existing sparse checkout with extra paths (e.g. a shared theme).
 
-    all_services = []
+    Cone mode only takes directories: a file entry (mkdocs.base.yml) adds its
+    parent directory instead, and top-level files are checked out already.
+    """
+    dirs = set()
+    for path in paths:
+        path = path.strip("/")
+        kind = subprocess.run(["git", "cat-file", "-t", f"HEAD:{path}"], cwd=dest,
+                              capture_output=True, text=True).stdout.strip()
+        if kind == "tree":
+            dirs.add(path)
+        elif kind == "blob":
+            if os.path.dirname(path):
+                dirs.add(os.path.dirname(path))
+        else:
+            print(f"  ✗ shared path {path} is not in the repo; skipping", file=sys.stderr)
+    if dirs:
+        run("git sparse-checkout add " + " ".join(map(shlex.quote, sorted(dirs))), cwd=dest)
 
-    for repo_entry in repos:
-        url = repo_entry["url"]
-        branch = repo_entry.get("branch", "main")
-        services = repo_entry.get("services", [])
 
-        slug = repo_slug(url)
-        clone_dest = os.path.join(build_dir, slug)
+def plain_mkdocs_build(service_root, target="docs-build"):
+    """Return mkdocs build options if the Justfile target is a plain `mkdocs build`.
+
+    Only a single-line recipe with no dependencies, variables or unknown flags
+    qualifies; returns None for anything else.
+    """
+    justfile = next((os.path.join(service_root, n) for n in ("Justfile", "justfile", ".justfile")
+                     if os.path.exists(os.path.join(service_root, n))), None)
+    if justfile is None:
+        return None
+    with open(justfile) as f:
+        lines = f.read().splitlines()
+
+    recipe = None
+    for i, line in enumerate(lines):
+        if line.split(":", 1)[0].strip() == target and not line.startswith((" ", "\t")):
+            if line.split(":", 1)[1].strip():
+                return None
+            recipe = []
+            for body in lines[i + 1:]:
+                if body and not body[0].isspace():
+                    break
+                if body.strip() and not body.strip().startswith("#"):
+                    recipe.append(body.strip())
+            break
+    if not recipe or len(recipe) != 1 or "{{" in recipe[0]:
+        return None
+
+    argv = shlex.split(recipe[0].lstrip("@-"))
+    if argv[:2] == ["mkdocs", "build"]:
+        argv = argv[2:]
+    elif argv[:4] == ["python", "-m", "mkdocs", "build"] or argv[:4] == ["python3", "-m", "mkdocs", "build"]:
+        argv = argv[4:]
+    else:
+        return None
+
+    opts = {"config_file": "mkdocs.yml", "site_dir": None, "strict": False}
+    while argv:
+        flag = argv.pop(0)
+        value = None
+        if flag.startswith("--") and "=" in flag:
+            flag, value = flag.split("=", 1)
+        if flag not in MKDOCS_BUILD_FLAGS:
+            return None
+        key = MKDOCS_BUILD_FLAGS[flag]
+        if key == "strict":
+            opts["strict"] = True
+        elif key:
+            if value is None:
+                if not argv:
+                    return None
+                value = argv.pop(0)
+            opts[key] = value
+    return opts
 
-        print(f"\n→ Cloning {slug} @ {branch}")
-        if os.path.exists(clone_dest):
-            shutil.rmtree(clone_dest)
-        run(f"git clone --depth=1 --branch {branch} {url} {clone_dest}")
 
-        for svc_entry in services:
-            docs_path = svc_entry["docs_path"]
-            service_root = os.path.join(clone_dest, docs_path)
+def _mkdocs_build(service_root, opts):
+    """Build worker entry point. Runs inside a pre-warmed forkserver child."""
+    from mkdocs.commands.build import build
+    from mkdocs.config import load_config
 
-            manifest_path = os.path.join(service_root, "docspine.yaml")
-            with open(manifest_path) as f:
-                manifest = yaml.safe_load(f)
+    os.chdir(service_root)
+    overrides = {"strict": opts["strict"]}
+    if opts["site_dir"]:
+        overrides["site_dir"] = opts["site_dir"]
+    config = load_config(config_file=opts["config_file"], **overrides)
+    build(config)
+
+
+class Builder:
+    """Runs service docs builds, in-process through a worker pool where possible.
+
+    With in_process disabled every build is `just docs-build` in a subprocess.
+    Otherwise services whose docs-build target is a plain mkdocs build are
+    handed to long-lived forkserver workers that import mkdocs once.
+    With remote worker URLs, every build is shipped to them instead
+    (buildfarm.py).
+    """
 
-            service_id = manifest.get("service", docs_path)
-            nav_title = manifest.get("nav_title", service_id)
-            domain = manifest.get("domain", "other")
-            team = manifest.get("team", "")
-            pages = manifest.get("pages", 0)
-            diataxis = manifest.get("diataxis", [])
-            output_dir = manifest.get("output_dir", "site").rstrip("/")
+    def __init__(self, in_process=False, workers=1, remote=()):
+        self.pool = None
+        self.remote = buildfarm.RemoteBuilder(remote) if remote else None
+        if self.remote or not in_process:
+            return
+        if importlib.util.find_spec("mkdocs") is None:
+            print("  (mkdocs not importable, using subprocess builds)")
+        else:
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(MKDOCS_PRELOAD)
+            self.pool = ctx.Pool(workers)
 
-            print(f"\n  → Building {domain}/{service_id}")
+    def add_services(self, service_roots):
+        """Announce a cloned repo's services (remote uploads leave out the others)."""
+        if self.remote:
+            self.remote.add_services(service_roots)
 
+    def build(self, service_root, output_dir="site"):
+        if self.remote:
+            self.remote.build(service_root, output_dir)
+            return
+        opts = plain_mkdocs_build(service_root) if self.pool else None
+        if opts is None:
             run("just docs-build", cwd=service_root)
+            return
+        print(f"  $ mkdocs build -f {opts['config_file']} (in-process)")
+        try:
+            self.pool.apply(_mkdocs_build, (os.path.abspath(service_root), opts))
+        except Exception as e:
+            print(f"  ✗ mkdocs build failed: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate registered service docs into dist/.")
+    parser.add_argument("--in-process", action="store_true",
+                        help="build plain-mkdocs services through pre-warmed worker processes")
+    parser.add_argument("--build-workers", type=int, default=1,
+                        help="number of in-process build workers (default: 1)")
+    parser.add_argument("--local-root", metavar="DIR",
+                        help="use existing checkouts at DIR/<repo-slug> instead of cloning")
+    parser.add_argument("--remote-worker", metavar="URL", action="append", default=[],
+                        help="offload builds to a build-worker.py at URL (repeatable)")
+    parser.add_argument("--no-build-cache", action="store_true",
+                        help=f"rebuild every service even if its inputs match {depgraph.CACHE_DIR}/")
+    return parser.parse_args(argv)
+
+
+def load_manifest(service_root):
+    with open(os.path.join(service_root, "docspine.yaml")) as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_registry(path=REGISTRY_FILE):
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def prepare_repo(repo_entry, build_dir, local_root=None):
+    """Clone one registry repo and read its service manifests.
+    Returns (clone_dest, {docs_path: manifest}).
+
+    With local_root set, an existing checkout at <local_root>/<slug> is used
+    in place (no clone) so local edits are built directly.
+    """
+    url = repo_entry["url"]
+    branch = repo_entry.get("branch", "main")
+    docs_paths = [s["docs_path"].strip("/") for s in repo_entry.get("services", [])]
+
+    slug = repo_slug(url)
+    local = os.path.join(local_root, slug) if local_root else None
+    if local and os.path.isdir(local):
+        print(f"\n→ Using local checkout {local}")
+        telemetry.log("clone", repo=slug, local=True)
+        return local, {p: load_manifest(os.path.join(local, p)) for p in docs_paths}
+    clone_dest = os.path.join(build_dir, slug)
+
+    print(f"\n→ Cloning {slug} @ {branch}")
+    start = time.monotonic()
+    if os.path.exists(clone_dest):
+        shutil.rmtree(clone_dest)
+    sparse = clone_repo(url, branch, clone_dest, docs_paths)
+
+    # Manifests can pull in paths outside their docs_path (shared mkdocs
+    # themes, snippets); add them to the sparse set before any build runs.
+    # The registry can also declare repo-wide shared_paths.
+    manifests = {p: load_manifest(os.path.join(clone_dest, p)) for p in docs_paths}
+    if sparse:
+        add_sparse_paths(clone_dest, [p for m in manifests.values() for p in shared_paths(repo_entry, m)])
+
+    _, nbytes = tree_size(clone_dest)
+    telemetry.CLONE_BYTES.inc(nbytes, repo=slug)
+    telemetry.log("clone", repo=slug, branch=branch, sparse=sparse, bytes=nbytes,
+                  duration_s=round(time.monotonic() - start, 3))
+    return clone_dest, manifests
+
+
+def shared_paths(repo_entry, manifest):
+    """Repo-relative paths a service's build reads besides its docs_path (see depgraph.py)."""
+    paths = list(repo_entry.get("shared_paths", [])) + list(manifest.get("shared_paths", []))
+    return [p.strip("/") for p in paths if p.strip("/")]
 
-            src = os.path.join(service_root, output_dir)
 
-            if group_by == "flat":
-                dst = os.path.join(dist_dir, service_id)
-            elif group_by == "team":
-                dst = os.path.join(dist_dir, team or domain, service_id)
+def service_record(manifest, docs_path, router=routing.DEFAULT):
+    """Build the routed Service record for a manifest. Returns (record, output_dir)."""
+    record = Service.from_manifest(manifest, docs_path)
+    router.route(record, docs_path)
+    return record, manifest.get("output_dir", "site").rstrip("/")
+
+
+def service_jobs(repo_entry, clone_dest, manifests, router=routing.DEFAULT):
+    """Yield (service_root, output_dir, record) for each service in a cloned repo."""
+    for svc_entry in repo_entry.get("services", []):
+        docs_path = svc_entry["docs_path"].strip("/")
+        record, output_dir = service_record(manifests[docs_path], docs_path, router)
+        yield os.path.join(clone_dest, docs_path), output_dir, record
+
+
+def service_dest(dist_dir, record):
+    return os.path.join(dist_dir, *record.path.split("/"))
+
+
+def tree_size(path):
+    """(file count, total bytes) under path."""
+    files = nbytes = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            nbytes += os.lstat(os.path.join(root, name)).st_size
+    return files, nbytes
+
+
+def copy_output(src, dst):
+    """Replace dst with a copy of src. Returns (files, bytes, pages): pages are
+    servicedb.scan_pages entries, hashed from the bytes as they are copied."""
+    pages = []
+
+    def copy(s_path, d_path):
+        rel = os.path.relpath(s_path, src).replace(os.sep, "/")
+        if not servicedb.is_page(rel):
+            return shutil.copy2(s_path, d_path)
+        with open(s_path, "rb") as f:
+            data = f.read()
+        with open(d_path, "wb") as f:
+            f.write(data)
+        shutil.copystat(s_path, d_path)
+        pages.append(servicedb.page_entry(rel, data))
+        return d_path
+
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, copy_function=copy)
+    print(f"  ✓ → {dst}/")
+    return (*tree_size(dst), sorted(pages))
+
+
+def sync_tree(src, dst):
+    """Make dst an exact copy of src, touching only files whose content differs.
+    Returns (copied, removed, pages): lists of paths relative to dst, and
+    servicedb.scan_pages entries for every page, hashed during the compare.
+    """
+    copied, removed, pages = [], [], []
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        os.makedirs(os.path.join(dst, rel_root), exist_ok=True)
+        for name in files:
+            rel = os.path.normpath(os.path.join(rel_root, name))
+            s_path, d_path = os.path.join(src, rel), os.path.join(dst, rel)
+            if servicedb.is_page(rel.replace(os.sep, "/")):
+                with open(s_path, "rb") as f:
+                    data = f.read()
+                pages.append(servicedb.page_entry(rel.replace(os.sep, "/"), data))
+                same = os.path.isfile(d_path) and os.path.getsize(d_path) == len(data)
+                if same:
+                    with open(d_path, "rb") as f:
+                        same = f.read() == data
             else:
-                dst = os.path.join(dist_dir, domain, service_id)
-
-            if os.path.exists(dst):
-                shutil.rmtree(dst)
-            shutil.copytree(src, dst)
-            print(f"  ✓ → dist/{domain}/{service_id}/")
-
-            all_services.append({
-                "id": service_id,
-                "name": nav_title,
-                "domain": domain,
-                "team": team,
-                "pages": pages,
-                "diataxis": diataxis,
-            })
+                same = (os.path.isfile(d_path) and os.path.getsize(d_path) == os.path.getsize(s_path)
+                        and filecmp.cmp(s_path, d_path, shallow=False))
+            if not same:
+                shutil.copy2(s_path, d_path)
+                copied.append(rel)
+    for root, dirs, files in os.walk(dst, topdown=False):
+        rel_root = os.path.relpath(root, dst)
+        for name in files:
+            rel = os.path.normpath(os.path.join(rel_root, name))
+            if not os.path.exists(os.path.join(src, rel)):
+                os.remove(os.path.join(dst, rel))
+                removed.append(rel)
+        if rel_root != "." and not os.path.exists(os.path.join(src, rel_root)):
+            os.rmdir(root)
+    return copied, removed, sorted(pages)
+
+
+def repo_head(path):
+    """Return (commit sha, ISO commit date) of a checkout, or (None, None)."""
+    try:
+        out = subprocess.check_output(["git", "log", "-1", "--format=%H %cI"],
+                                      cwd=path, text=True, stderr=subprocess.DEVNULL)
+        sha, date = out.split()
+        return sha, date
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return None, None
+
+
+def report_build(record, duration, outcome):
+    if outcome != "cached":
+        telemetry.BUILD_SECONDS.observe(duration, outcome=outcome)
+    if outcome == "failed":
+        telemetry.FAILURES.inc(stage="build")
+    telemetry.log("build", service=record.id, domain=record.domain, outcome=outcome,
+                  duration_s=round(duration, 3))
+
 
+def report_copy(record, files, nbytes):
+    telemetry.COPIED_FILES.inc(files)
+    telemetry.COPIED_BYTES.inc(nbytes)
+    telemetry.log("copy", service=record.id, path=record.path, files=files, bytes=nbytes)
+
+
+def timed_build(builder, service_root, output_dir="site"):
+    """Build one service. Returns (duration in seconds, "ok" | "failed")."""
+    start = time.monotonic()
+    try:
+        builder.build(service_root, output_dir)
+    except SystemExit:
+        return time.monotonic() - start, "failed"
+    return time.monotonic() - start, "ok"
+
+
+def cached_build(builder, graph, record, service_root, output_dir, use_cache=True):
+    """Build a service unless a cached build has exactly its current inputs.
+    Returns (site_dir, duration, outcome, fingerprint); outcome is "ok",
+    "cached" or "failed". Once site_dir is final, hand fingerprint to
+    depgraph.save_output so the next run can reuse it.
+    """
+    fingerprint = graph.fingerprint(service_root)
+    cached = depgraph.cached_output(record.id, fingerprint[0]) if use_cache else None
+    if cached:
+        print(f"  ✓ {record.id}: inputs unchanged, reusing cached build")
+        telemetry.CACHE_HITS.inc(cache="builds")
+        return cached, 0.0, "cached", fingerprint
+    telemetry.CACHE_MISSES.inc(cache="builds")
+    changed = depgraph.changed_inputs(record.id, fingerprint[1])
+    if changed:
+        print(f"  → {record.id}: {', '.join(changed)} changed")
+    duration, outcome = timed_build(builder, service_root, output_dir)
+    return os.path.join(service_root, output_dir), duration, outcome, fingerprint
+
+
+def write_services_json(services, build_dir=BUILD_DIR):
     services_json_path = os.path.join(build_dir, "services.json")
-    with open(services_json_path, "w") as f:
-        json.dump(all_services, f, indent=2)
-    print(f"\n✓ services.json written to {services_json_path} ({len(all_services)} services)")
+    tmp = f"{services_json_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump([s.to_record() for s in services], f, indent=2)
+    os.replace(tmp, services_json_path)
+    print(f"\n✓ services.json written to {services_json_path} ({len(services)} services)")
+
+
+def main():
+    args = parse_args()
+    registry = load_registry()
+
+    router = routing.Router.from_registry(registry)
+    repos = registry.get("repos", [])
+
+    all_services = []
+    ws = workspace.Workspace(BUILD_DIR, DIST_DIR)
+    builder = Builder(in_process=args.in_process, workers=args.build_workers, remote=args.remote_worker)
+    graph = depgraph.DepGraph()
+    conn = servicedb.connect()
+    run_id = servicedb.start_run(conn)
+    previous_routes = servicedb.route_table(conn)
+    telemetry.configure(run_id)
+    status = "failed"
+
+    try:
+        for repo_entry in repos:
+            clone_dest, manifests = prepare_repo(repo_entry, ws.clones, args.local_root)
+            repo_id = servicedb.upsert_repo(conn, Repo.from_entry(repo_entry, *repo_head(clone_dest)))
+
+            jobs = list(service_jobs(repo_entry, clone_dest, manifests, router))
+            builder.add_services([job[0] for job in jobs])
+            for (service_root, output_dir, _), svc_entry in zip(jobs, repo_entry.get("services", [])):
+                graph.add(service_root, output_dir, clone_dest,
+                          shared_paths(repo_entry, manifests[svc_entry["docs_path"].strip("/")]))
+            for service_root, output_dir, record in jobs:
+                print(f"\n  → Building {record.domain}/{record.id}")
+                site_dir, duration, outcome, fingerprint = cached_build(
+                    builder, graph, record, service_root, output_dir, not args.no_build_cache)
+                servicedb.record_build(conn, run_id, record.id, duration, outcome)
+                report_build(record, duration, outcome)
+                if outcome == "failed":
+                    sys.exit(1)
+                dest = service_dest(ws.dist, record)
+                if outcome == "ok":
+                    facets.annotate_site(site_dir, record)
+                    depgraph.save_output(record.id, *fingerprint, site_dir)
+                files, nbytes, pages = copy_output(site_dir, dest)
+                report_copy(record, files, nbytes)
+                servicedb.upsert_service(conn, record, repo_id, os.path.relpath(service_root, clone_dest),
+                                         len(all_services))
+                servicedb.sync_pages(conn, record.id, pages)
+                all_services.append(record)
+
+        servicedb.prune_services(conn, [r.id for r in all_services])
+        previous_routes = router.previous_paths(previous_routes, all_services)
+        servicedb.record_moves(conn, routing.moved(previous_routes, {r.id: r.path for r in all_services}), run_id)
+        routing.write_redirects(ws.dist, servicedb.redirect_rows(conn, run_id))
+        write_services_json(all_services)
+        ws.publish()
+        status = "ok"
+    finally:
+        servicedb.finish_run(conn, run_id, status)
+        conn.close()
+        builder.close()
+        ws.close()
+        telemetry.SERVICES.set(len(all_services))
+        telemetry.LAST_RUN.set(int(time.time()), status=status)
+        telemetry.log("run", status=status, services=len(all_services))
+        telemetry.write_metrics()
+        telemetry.close()
 
     total = sum(r.get("services") and len(r["services"]) or 0 for r in repos)
-    print(f"✓ Aggregated {total} service(s) into {dist_dir}/")
+    print(f"✓ Aggregated {total} service(s) into {DIST_DIR}/")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Build worker for remote build offload (see buildfarm.py for the protocol).
+
+Accepts repo tarballs over HTTP, runs `just docs-build` in the requested
+service directory and serves the built output back as a tarball. Run one per
+build host; with the defaults it doubles as the local stand-in, so the whole
+offload path can be exercised on one machine:
+
+  python scripts/build-worker.py --port 8750 --jobs 4 &
+  python scripts/pipeline.py --remote-worker http://127.0.0.1:8750
+
+Jobs are unpacked under jobs/ in --work-dir (default _build/worker/) and
+deleted once the client fetches the output, or after an hour if it never
+does. Set
+DOCSPINE_BUILD_TOKEN on both sides to require a shared bearer token.
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import buildfarm
+
+WORK_DIR = os.path.join("_build", "worker")
+LOG_LINES = 200
+JOB_TTL = 3600
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(/output)?$")
+
+
+class Job:
+    def __init__(self, job_dir, service, output_dir):
+        self.id = os.path.basename(job_dir)
+        self.dir = job_dir
+        self.service = service
+        self.output_dir = output_dir
+        self.state = "queued"
+        self.log = deque(maxlen=LOG_LINES)
+        self.updated = time.time()
+
+    def status(self):
+        return {"id": self.id, "state": self.state, "service": self.service, "log": "\n".join(self.log)}
+
+
+class Worker:
+    def __init__(self, work_dir, jobs):
+        self.work_dir = os.path.join(work_dir, "jobs")
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        os.makedirs(self.work_dir, exist_ok=True)
+        # Job directories a previous worker left behind; anything else in
+        # work_dir belongs to someone else.
+        for name in os.listdir(self.work_dir):
+            if re.fullmatch(r"[0-9a-f]{32}", name):
+                shutil.rmtree(os.path.join(self.work_dir, name), ignore_errors=True)
+        for _ in range(jobs):
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, body, service, output_dir):
+        job = Job(os.path.join(self.work_dir, uuid.uuid4().hex), service, output_dir)
+        buildfarm.unpack(body, os.path.join(job.dir, "src"))
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def drop(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+        if job:
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            stale = [j.id for j in self.jobs.values() if j.state in ("ok", "failed") and now - j.updated > JOB_TTL]
+        for job_id in stale:
+            self.drop(job_id)
+
+    def _loop(self):
+        while True:
+            job = self.queue.get()
+            job.state = "running"
+            start = time.monotonic()
+            cwd = os.path.join(job.dir, "src", *job.service.split("/"))
+            try:
+                proc = subprocess.Popen(["just", "docs-build"], cwd=cwd, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, text=True, errors="replace")
+                for line in proc.stdout:
+                    job.log.append(line.rstrip("\n"))
+                ok = proc.wait() == 0 and os.path.isdir(os.path.join(cwd, job.output_dir))
+            except OSError as e:
+                job.log.append(f"✗ {e}")
+                ok = False
+            job.state = "ok" if ok else "failed"
+            job.updated = time.time()
+            print(f"  {'✓' if ok else '✗'} {job.service} ({job.id[:8]}) {job.state} "
+                  f"in {time.monotonic() - start:.1f}s")
+            self.expire()
+
+
+class Handler(BaseHTTPRequestHandler):
+    worker = None
+    token = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if self.token and self.headers.get("Authorization") != f"Bearer {self.token}":
+            self._send_json(HTTPStatus.UNAUTHORIZED, {"error": "bad or missing token"})
+            return False
+        return True
+
+    def _job(self):
+        m = _JOB_PATH.match(self.path)
+        job = self.worker.get(m.group(1)) if m else None
+        if job is None:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "no such job"})
+        return job, bool(m and m.group(2))
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path != "/jobs":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+        service = self.headers.get("X-Docspine-Service", ".").strip("/") or "."
+        output_dir = self.headers.get("X-Docspine-Output", "site").strip("/") or "site"
+        if ".." in service.split("/") or ".." in output_dir.split("/"):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "paths must stay inside the upload"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            job = self.worker.submit(_Body(self.rfile, length), service, output_dir)
+        except Exception as e:  # tarfile raises several types for a bad upload
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"bad upload: {e}"})
+            return
+        print(f"  → {service} queued as {job.id[:8]}")
+        self._send_json(HTTPStatus.ACCEPTED, {"id": job.id})
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        job, output = self._job()
+        if job is None:
+            return
+        if not output:
+            self._send_json(HTTPStatus.OK, job.status())
+            return
+        if job.state != "ok":
+            self._send_json(HTTPStatus.CONFLICT, {"error": f"job is {job.state}"})
+            return
+        tarball = os.path.join(job.dir, "output.tar.gz")
+        if not os.path.exists(tarball):
+            # One temp file per request: concurrent fetches of the same job
+            # each pack their own copy and the last rename wins.
+            with tempfile.NamedTemporaryFile(dir=job.dir, suffix=".tmp", delete=False) as f:
+                buildfarm.pack(os.path.join(job.dir, "src", *job.service.split("/"), job.output_dir), f)
+            os.replace(f.name, tarball)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/gzip")
+        self.send_header("Content-Length", str(os.path.getsize(tarball)))
+        self.end_headers()
+        with open(tarball, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        job, _ = self._job()
+        if job is not None:
+            self.worker.drop(job.id)
+            self._send_json(HTTPStatus.OK, {"id": job.id, "state": "deleted"})
+
+
+class _Body:
+    """Read at most Content-Length bytes of a request body."""
+
+    def __init__(self, rfile, length):
+        self.rfile, self.left = rfile, length
+
+    def read(self, size=-1):
+        if self.left <= 0:
+            return b""
+        size = self.left if size < 0 else min(size, self.left)
+        data = self.rfile.read(size)
+        self.left -= len(data)
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve docs-build jobs for remote build offload.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="concurrent builds")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    args = parser.parse_args()
+
+    Handler.worker = Worker(args.work_dir, args.jobs)
+    Handler.token = os.environ.get(buildfarm.TOKEN_ENV)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"✓ Build worker on http://{args.host}:{args.port} ({args.jobs} concurrent builds, "
+          f"{'token required' if Handler.token else 'no token'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n✓ Worker stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
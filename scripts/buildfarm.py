@@ -0,0 +1,170 @@
+"""
+Remote build offload.
+
+With one or more --remote-worker URLs, aggregate.py / pipeline.py still clone
+each repo once but hand the `just docs-build` runs to build workers
+(build-worker.py) on other hosts, so builds scale out without every machine
+cloning every repo. The protocol is plain HTTP with gzipped tarballs:
+
+  POST   /jobs              body: tar.gz of the repo checkout (no .git, no
+                            other services' docs), with X-Docspine-Service
+                            (docs_path) and X-Docspine-Output (output_dir)
+                            headers → 202 {"id": ...}
+  GET    /jobs/<id>         → {"state": "queued" | "running" | "ok" | "failed",
+                               "log": last lines of build output}
+  GET    /jobs/<id>/output  → tar.gz of <docs_path>/<output_dir>
+  DELETE /jobs/<id>         drop the job's files on the worker
+
+Every request carries `Authorization: Bearer $DOCSPINE_BUILD_TOKEN` when the
+variable is set; workers started with a token reject anything else. A worker
+runs whatever docs-build recipe it is sent, so only expose it to the CI
+network.
+
+Jobs go to the worker with the fewest in flight; a worker that cannot be
+reached is passed over for a minute and the job is retried on the next one.
+"""
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import telemetry
+
+TOKEN_ENV = "DOCSPINE_BUILD_TOKEN"
+POLL_SECONDS = 1.0
+JOB_TIMEOUT = 3600
+DOWN_SECONDS = 60  # how long an unreachable worker is passed over
+
+
+def pack(root, fileobj, exclude=()):
+    """Write root as a gzipped tarball to fileobj, skipping .git and the
+    (root-relative, POSIX) paths in exclude."""
+    skip = {".git", *exclude}
+
+    def keep(info):
+        rel = info.name.split("/", 1)[1] if "/" in info.name else ""
+        return None if any(rel == p or rel.startswith(p + "/") for p in skip) else info
+
+    with tarfile.open(fileobj=fileobj, mode="w:gz", compresslevel=6) as tar:
+        tar.add(root, arcname=".", filter=keep)
+
+
+def unpack(fileobj, dest):
+    """Extract a tarball from pack() into dest, refusing links and paths that
+    would land outside it."""
+    os.makedirs(dest, exist_ok=True)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        tar.extractall(dest, filter="data")
+
+
+def repo_root(service_root):
+    """Nearest directory above service_root with a .git, else service_root."""
+    path = os.path.abspath(service_root)
+    while path != os.path.dirname(path):
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+        path = os.path.dirname(path)
+    return os.path.abspath(service_root)
+
+
+class RemoteBuilder:
+    """Builds services on remote workers; a drop-in for aggregate.Builder.build."""
+
+    def __init__(self, workers, token=None, timeout=JOB_TIMEOUT):
+        self.workers = [w.rstrip("/") for w in workers]
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+        self.timeout = timeout
+        self.in_flight = dict.fromkeys(self.workers, 0)
+        self.down = {}  # worker → time it was last unreachable
+        self.siblings = {}  # repo root → docs paths of every service in it
+        self.lock = threading.Lock()
+
+    def add_services(self, service_roots):
+        """Register a repo's services so each upload can leave out the others."""
+        for service_root in service_roots:
+            root = repo_root(service_root)
+            rel = os.path.relpath(os.path.abspath(service_root), root).replace(os.sep, "/")
+            self.siblings.setdefault(root, set()).add(rel)
+
+    def _request(self, worker, method, path, body=None, headers=None):
+        req = urllib.request.Request(f"{worker}{path}", data=body, method=method, headers=dict(headers or {}))
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        return urllib.request.urlopen(req, timeout=60)
+
+    def _pick(self, tried):
+        with self.lock:
+            candidates = [w for w in self.workers if w not in tried]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            worker = min(candidates, key=lambda w: (now - self.down.get(w, -DOWN_SECONDS) < DOWN_SECONDS,
+                                                    self.in_flight[w]))
+            self.in_flight[worker] += 1
+            return worker
+
+    def build(self, service_root, output_dir="site"):
+        root = repo_root(service_root)
+        rel = os.path.relpath(os.path.abspath(service_root), root).replace(os.sep, "/")
+        others = sorted(self.siblings.get(root, set()) - {rel} - {"."})
+        headers = {"Content-Type": "application/gzip", "X-Docspine-Service": rel,
+                   "X-Docspine-Output": output_dir}
+        with tempfile.TemporaryFile() as upload:
+            pack(root, upload, exclude=[p for p in others if not rel.startswith(p + "/")])
+            headers["Content-Length"] = str(upload.tell())
+            tried = set()
+            while (worker := self._pick(tried)) is not None:
+                tried.add(worker)
+                try:
+                    upload.seek(0)
+                    return self._run(worker, upload, headers, rel, os.path.join(service_root, output_dir))
+                except (OSError, urllib.error.URLError) as e:
+                    print(f"  ✗ Worker {worker} unavailable ({e}); trying another", file=sys.stderr)
+                    with self.lock:
+                        self.down[worker] = time.monotonic()
+                    telemetry.FAILURES.inc(stage="remote-worker")
+                finally:
+                    with self.lock:
+                        self.in_flight[worker] -= 1
+        print(f"  ✗ No build worker could take {rel}", file=sys.stderr)
+        sys.exit(1)
+
+    def _run(self, worker, upload, headers, rel, output_path):
+        start = time.monotonic()
+        with self._request(worker, "POST", "/jobs", upload, headers) as resp:
+            job = json.load(resp)["id"]
+        print(f"  $ just docs-build ({rel} on {worker}, job {job})")
+        try:
+            while True:
+                with self._request(worker, "GET", f"/jobs/{job}") as resp:
+                    status = json.load(resp)
+                if status["state"] in ("ok", "failed"):
+                    break
+                if time.monotonic() - start > self.timeout:
+                    status = {"state": "failed", "log": f"timed out after {self.timeout}s"}
+                    break
+                time.sleep(POLL_SECONDS)
+            if status["state"] != "ok":
+                for line in status.get("log", "").splitlines()[-20:]:
+                    print(f"    {line}", file=sys.stderr)
+                print(f"  ✗ Remote build of {rel} failed", file=sys.stderr)
+                sys.exit(1)
+            with self._request(worker, "GET", f"/jobs/{job}/output") as resp:
+                data = io.BytesIO(resp.read())
+            if os.path.exists(output_path):
+                shutil.rmtree(output_path)
+            unpack(data, output_path)
+            telemetry.log("remote_build", service=rel, worker=worker, job=job,
+                          bytes=data.getbuffer().nbytes, duration_s=round(time.monotonic() - start, 3))
+        finally:
+            try:
+                self._request(worker, "DELETE", f"/jobs/{job}").close()
+            except (OSError, urllib.error.URLError):
+                pass
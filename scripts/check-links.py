@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Checks internal links and anchors across the assembled site in dist/.
+
+Builds one in-memory index of every file in dist/ and every id/name anchor in
+every HTML page, then resolves each page's href/src references against it.
+Cross-service links (including those broken by a routing template change)
+are checked the same way as links within a service.
+
+Parsing is the expensive part, so each page's extracted anchors and links are
+cached in _build/linkcheck-cache.json keyed by content hash and only changed
+pages are re-parsed (in a process pool). Every link is still re-resolved on
+each run, so a page whose target moved is caught even if the page itself did
+not change.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlsplit
+
+import telemetry
+
+BASE_URL = "https://nondualworks.github.io/docspine-demo"
+DIST_DIR = "dist"
+CACHE_FILE = os.path.join("_build", "linkcheck-cache.json")
+LINK_ATTRS = {
+    "a": "href", "area": "href", "link": "href", "img": "src", "script": "src",
+    "iframe": "src", "source": "src", "video": "src", "audio": "src",
+}
+
+
+class PageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.ids = set()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        for key in ("id", "name") if tag == "a" else ("id",):
+            if attrs.get(key):
+                self.ids.add(attrs[key])
+        attr = LINK_ATTRS.get(tag)
+        if attr and attrs.get(attr):
+            if tag == "link" and attrs.get("rel") in ("preconnect", "dns-prefetch"):
+                return
+            self.links.append(attrs[attr])
+
+
+def parse_page(path):
+    """Return (ids, links) for one HTML file."""
+    parser = PageParser()
+    with open(path, encoding="utf-8", errors="replace") as f:
+        parser.feed(f.read())
+    return sorted(parser.ids), parser.links
+
+
+def content_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def resolve(link, page_rel, base_path):
+    """Map a link on page_rel to (site-relative path, fragment); None if external."""
+    parts = urlsplit(link)
+    if parts.scheme or parts.netloc:
+        base = urlsplit(BASE_URL)
+        same_site = (parts.scheme.lower() in ("", base.scheme) and parts.netloc.lower() == base.netloc
+                     and (parts.path + "/").startswith(base.path.rstrip("/") + "/"))
+        if not same_site:
+            return None
+        path = parts.path
+    else:
+        path = parts.path
+    path = unquote(path)
+
+    if not path:
+        target = page_rel
+    elif path.startswith("/"):
+        if base_path and (path + "/").startswith(base_path + "/"):
+            path = path[len(base_path):]
+        target = os.path.normpath(path.lstrip("/")) if path.strip("/") else ""
+    else:
+        target = os.path.normpath(os.path.join(os.path.dirname(page_rel), path))
+    if path.endswith("/") or target in ("", "."):
+        target = os.path.join(target, "index.html") if target not in ("", ".") else "index.html"
+    return target.replace(os.sep, "/"), parts.fragment
+
+
+def check_site(site_dir, cache_file=CACHE_FILE, workers=None):
+    """Check every internal link in site_dir and print a report.
+    Returns the number of broken links.
+    """
+    files = set()
+    pages = []
+    for root, _, names in os.walk(site_dir):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), site_dir).replace(os.sep, "/")
+            files.add(rel)
+            # Per-service 404 templates use site_url-absolute paths and are
+            # never served below the site root, so only the root one counts.
+            if name.endswith(".html") and (name != "404.html" or rel == name):
+                pages.append(rel)
+
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    full = [os.path.join(site_dir, p) for p in pages]
+    with ProcessPoolExecutor(workers) as pool:
+        hashes = list(pool.map(content_hash, full, chunksize=64))
+        todo = sorted({h: p for h, p in zip(hashes, full) if h not in cache}.items())
+        for (digest, _), (ids, links) in zip(todo, pool.map(parse_page, [p for _, p in todo], chunksize=16)):
+            cache[digest] = {"ids": ids, "links": links}
+
+    telemetry.CACHE_HITS.inc(len(set(hashes)) - len(todo), cache="linkcheck")
+    telemetry.CACHE_MISSES.inc(len(todo), cache="linkcheck")
+
+    anchors = {page: set(cache[h]["ids"]) for page, h in zip(pages, hashes)}
+    base_path = urlsplit(BASE_URL).path.rstrip("/")
+    broken = defaultdict(list)
+    checked = 0
+    for page, digest in zip(pages, hashes):
+        for link in cache[digest]["links"]:
+            resolved = resolve(link, page, base_path)
+            if resolved is None:
+                continue
+            checked += 1
+            target, fragment = resolved
+            if target not in files and target + "/index.html" in files:
+                target += "/index.html"
+            if target not in files:
+                broken[page].append(f"{link} (missing {target})")
+            elif fragment and target in anchors and fragment not in anchors[target]:
+                broken[page].append(f"{link} (no #{fragment} in {target})")
+
+    live = set(hashes)
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    tmp = f"{cache_file}.{os.getpid()}.tmp"  # concurrent runs never see a torn cache
+    with open(tmp, "w") as f:
+        json.dump({h: v for h, v in cache.items() if h in live}, f)
+    os.replace(tmp, cache_file)
+
+    for page in sorted(broken):
+        print(f"  ✗ {page}", file=sys.stderr)
+        for item in broken[page]:
+            print(f"      → {item}", file=sys.stderr)
+    total = sum(len(v) for v in broken.values())
+    print(f"{'✗' if total else '✓'} Checked {checked} internal links on {len(pages)} pages "
+          f"({len(todo)} re-parsed): {total} broken")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check internal links and anchors in dist/.")
+    parser.add_argument("--site", default=DIST_DIR)
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--warn-only", action="store_true", help="report broken links but exit 0")
+    args = parser.parse_args()
+
+    if check_site(args.site, args.cache, args.workers) and not args.warn_only:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Minifies HTML, CSS and JS in dist/ and writes precompressed .gz / .br siblings.
+
+Runs after the site is fully assembled (after Pagefind). Work is spread over a
+process pool and cached in _build/compress-cache/ by content hash, so files
+that have not changed since the last run are restored from the cache instead
+of being minified and compressed again.
+
+Minification uses minify-html / rcssmin / rjsmin when installed; a file type
+whose minifier is missing is compressed as is. Brotli output needs the
+`brotli` package; gzip is always written. Cache entries the current build did
+not use are pruned once it finishes.
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+import workspace
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import minify_html
+except ImportError:
+    minify_html = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+DIST_DIR = "dist"
+CACHE_DIR = os.path.join("_build", "compress-cache")
+MIN_EXTS = {".html", ".css", ".js"}
+COMPRESS_EXTS = MIN_EXTS | {".json", ".svg", ".xml", ".txt", ".map", ".mjs"}
+COMPRESS_MIN_BYTES = 1024
+# Bump when minifier or compressor settings change to invalidate the cache.
+CACHE_VERSION = b"2"
+
+
+def minify_css(text):
+    return rcssmin.cssmin(text) if rcssmin else text
+
+
+def minify_js(text):
+    return rjsmin.jsmin(text) if rjsmin else text
+
+
+def minify_html_text(text):
+    if minify_html:
+        return minify_html.minify(text, minify_css=True, minify_js=bool(rjsmin))
+    return text
+
+
+MINIFIERS = {".html": minify_html_text, ".css": minify_css, ".js": minify_js}
+
+
+def process_file(path, cache_dir):
+    """Minify and precompress one file.
+    Returns (status, cache key, bytes_before, bytes_after)."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha256(CACHE_VERSION + data).hexdigest()
+    entry = os.path.join(cache_dir, key[:2], key)
+
+    status = "hit"
+    if not os.path.isdir(entry):
+        status = "miss"
+        out = data
+        if ext in MINIFIERS:
+            try:
+                out = MINIFIERS[ext](data.decode("utf-8")).encode("utf-8")
+            except UnicodeDecodeError:
+                pass
+        tmp = f"{entry}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        if out != data:
+            with open(os.path.join(tmp, "min"), "wb") as f:
+                f.write(out)
+        if len(out) >= COMPRESS_MIN_BYTES:
+            with open(os.path.join(tmp, "gz"), "wb") as f:
+                f.write(gzip.compress(out, compresslevel=9, mtime=0))
+            if brotli:
+                with open(os.path.join(tmp, "br"), "wb") as f:
+                    f.write(brotli.compress(out, quality=11))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)  # another worker cached the same content first
+
+    minified = os.path.join(entry, "min")
+    if os.path.exists(minified):
+        install(minified, path)
+    for suffix in ("gz", "br"):
+        cached = os.path.join(entry, suffix)
+        if os.path.exists(cached):
+            install(cached, f"{path}.{suffix}")
+    return status, key, len(data), os.path.getsize(path)
+
+
+def install(src, dst):
+    """Copy via a temp file and rename, so hardlinked copies (dedup-assets.py)
+    are replaced rather than written through while other workers read them."""
+    tmp = f"{dst}.tmp{os.getpid()}"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def collect(site_dir):
+    for root, _, files in os.walk(site_dir):
+        for name in files:
+            ext = os.path.splitext(name)[1].lower()
+            if ext in COMPRESS_EXTS:
+                yield os.path.join(root, name)
+
+
+def prune_cache(cache_dir, used):
+    """Delete cache entries (and stray temp dirs) whose key is not in used."""
+    pruned = 0
+    for shard in os.listdir(cache_dir):
+        shard_dir = os.path.join(cache_dir, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            if name not in used:
+                shutil.rmtree(os.path.join(shard_dir, name), ignore_errors=True)
+                pruned += 1
+    return pruned
+
+
+def compress_site(site_dir, cache_dir=CACHE_DIR, workers=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    for i in range(256):
+        os.makedirs(os.path.join(cache_dir, f"{i:02x}"), exist_ok=True)
+
+    paths = sorted(collect(site_dir))
+    hits = before = after = 0
+    used = set()
+    # Held until pruning is done, so a concurrent run never loses an entry
+    # between creating it and installing from it.
+    with workspace.lock("compress-cache"):
+        with ProcessPoolExecutor(workers) as pool:
+            for status, key, b, a in pool.map(process_file, paths, [cache_dir] * len(paths), chunksize=32):
+                hits += status == "hit"
+                used.add(key)
+                before += b
+                after += a
+        pruned = prune_cache(cache_dir, used)
+
+    telemetry.CACHE_HITS.inc(hits, cache="compress")
+    telemetry.CACHE_MISSES.inc(len(paths) - hits, cache="compress")
+    print(f"✓ Processed {len(paths)} text assets in {site_dir}/ ({hits} cached, {len(paths) - hits} new)")
+    print(f"  minified {before} → {after} bytes"
+          + ("" if brotli else " (brotli not installed, .br skipped)"))
+    missing = [name for name, mod in (("minify-html", minify_html), ("rcssmin", rcssmin), ("rjsmin", rjsmin))
+               if mod is None]
+    if missing:
+        print(f"  → {', '.join(missing)} not installed; those file types were not minified")
+    if pruned:
+        print(f"  pruned {pruned} unused cache entr{'y' if pruned == 1 else 'ies'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify and precompress text assets in dist/.")
+    parser.add_argument("--site", default=DIST_DIR)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    compress_site(args.site, args.cache, args.workers)
+
+
+if __name__ == "__main__":
+    main()
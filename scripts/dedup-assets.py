@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Deduplicates identical theme assets across services in dist/.
+
+Every mkdocs-material service ships the same JS, CSS, fonts and search workers
+under dist/<domain>/<service>/assets/. This pass hashes those files and keeps
+one copy of each distinct file in a content-addressed dist/_shared/ directory:
+
+  default    every duplicate is replaced by a hardlink to its _shared/ copy.
+             URLs are unchanged; disk use and copy time drop.
+  --rewrite  stylesheets, fonts and images are moved into _shared/ and the
+             references to them in HTML and CSS are rewritten, so the
+             published artifact shrinks too (Pages artifacts dereference
+             hardlinks). Scripts stay where they are, hardlinked to each
+             other without a _shared/ copy, because they resolve sibling
+             files (search workers, lunr languages) relative to their own
+             URL at runtime.
+
+Runs after aggregate.py and before Pagefind / compress-assets.py.
+"""
+import argparse
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+DIST_DIR = "dist"
+SHARED_DIR = "_shared"
+ASSETS_SEGMENT = "assets"
+REWRITE_EXTS = {
+    ".css", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico",
+}
+REF_EXTS = {".html", ".css"}
+
+_QUOTED = re.compile(r"""(["'])([^"'\s<>]+)\1""")
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")\s]+)\1\s*\)""")
+_SRCSET = re.compile(r"""(\ssrcset=)(["'])([^"']+)\2""", re.I)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def shared_path(site_dir, digest, path):
+    return os.path.join(site_dir, SHARED_DIR, digest[:16], os.path.basename(path))
+
+
+def collect_assets(site_dir):
+    """Group every file below an assets/ directory by content hash."""
+    groups = defaultdict(list)
+    for root, dirs, files in os.walk(site_dir):
+        if os.path.relpath(root, site_dir).split(os.sep)[0] == SHARED_DIR:
+            dirs[:] = []
+            continue
+        rel_parts = os.path.relpath(root, site_dir).split(os.sep)
+        if ASSETS_SEGMENT not in rel_parts:
+            continue
+        for name in files:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                groups[file_sha256(path)].append(path)
+    return {d: sorted(paths) for d, paths in groups.items() if len(paths) > 1}
+
+
+def split_ref(ref):
+    """Split a relative URL into (path, suffix); None for anything non-relative."""
+    if ref.startswith(("/", "#", "data:", "//")) or re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*:", ref):
+        return None
+    cut = min((i for i in (ref.find("?"), ref.find("#")) if i >= 0), default=len(ref))
+    return ref[:cut], ref[cut:]
+
+
+def css_refs(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    refs = set()
+    for m in _CSS_URL.finditer(text):
+        parts = split_ref(m.group(2))
+        if parts and parts[0]:
+            refs.add(os.path.normpath(os.path.join(os.path.dirname(path), parts[0])))
+    return refs
+
+
+def plan_moves(site_dir, groups):
+    """Pick the groups that can be moved to _shared/ with references rewritten.
+
+    Fonts and images always qualify. A stylesheet qualifies only when every
+    url() it contains points at a file that is itself being moved, so the
+    single shared copy resolves correctly for every service.
+    """
+    by_path = {p: d for d, paths in groups.items() for p in paths}
+    candidates = {d for d, paths in groups.items()
+                  if os.path.splitext(paths[0])[1].lower() in REWRITE_EXTS}
+    css_targets = {d: [css_refs(p) for p in groups[d]] for d in candidates
+                   if groups[d][0].lower().endswith(".css")}
+
+    changed = True
+    while changed:
+        changed = False
+        for digest, member_refs in css_targets.items():
+            if digest not in candidates:
+                continue
+            ok = all(by_path.get(ref) in candidates for refs in member_refs for ref in refs)
+            # Members must agree on what each url() resolves to.
+            ok = ok and len({frozenset(by_path[r] for r in refs) for refs in member_refs}) == 1
+            if not ok:
+                candidates.discard(digest)
+                changed = True
+
+    return {p: shared_path(site_dir, d, groups[d][0]) for d in candidates for p in groups[d]}
+
+
+def rewrite_refs(text, src_dir, out_dir, moves, css_only=False):
+    """Point relative references resolved from src_dir at their moved location."""
+    def moved(ref):
+        parts = split_ref(ref)
+        if not parts or not parts[0]:
+            return ref
+        target = os.path.normpath(os.path.join(src_dir, parts[0]))
+        if target in moves:
+            target = moves[target]
+        elif src_dir == out_dir:
+            return ref
+        return os.path.relpath(target, out_dir).replace(os.sep, "/") + parts[1]
+
+    def sub(m, group):
+        return m.group(0).replace(m.group(group), moved(m.group(group)), 1)
+
+    def sub_srcset(m):
+        # "a.480w.png 480w, a.png 1200w": rewrite the URL of each candidate.
+        candidates = []
+        for candidate in m.group(3).split(","):
+            url, _, descriptor = candidate.strip().partition(" ")
+            candidates.append(f"{moved(url)} {descriptor}".rstrip())
+        return f"{m.group(1)}{m.group(2)}{', '.join(candidates)}{m.group(2)}"
+
+    text = _CSS_URL.sub(lambda m: sub(m, 2), text)
+    if not css_only:
+        text = _SRCSET.sub(sub_srcset, text)
+        text = _QUOTED.sub(lambda m: sub(m, 2), text)
+    return text
+
+
+def apply_rewrite(site_dir, groups, moves):
+    """Move planned groups into _shared/ and rewrite references site-wide."""
+    for digest, paths in groups.items():
+        if paths[0] not in moves:
+            continue
+        dest = moves[paths[0]]
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if paths[0].lower().endswith(".css"):
+            with open(paths[0], encoding="utf-8") as f:
+                text = f.read()
+            text = rewrite_refs(text, os.path.dirname(paths[0]), os.path.dirname(dest), moves, css_only=True)
+            with open(dest, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            os.replace(paths[0], dest)
+
+    for root, dirs, files in os.walk(site_dir):
+        if os.path.relpath(root, site_dir).split(os.sep)[0] == SHARED_DIR:
+            dirs[:] = []
+            continue
+        for name in files:
+            path = os.path.join(root, name)
+            if path in moves or os.path.splitext(name)[1].lower() not in REF_EXTS:
+                continue
+            with open(path, encoding="utf-8", errors="surrogateescape") as f:
+                text = f.read()
+            new = rewrite_refs(text, root, root, moves, css_only=name.lower().endswith(".css"))
+            if new != text:
+                with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+                    f.write(new)
+
+    for path in moves:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def hardlink(site_dir, groups, skip, shared=True):
+    """Replace each duplicate with a hardlink to one copy of its group.
+
+    The copy is kept in _shared/ when shared is set; otherwise (--rewrite,
+    where nothing references the groups left behind) every duplicate links to
+    the group's first member and _shared/ gets nothing extra to publish.
+    Returns (files, bytes) newly linked; copies that already share the inode
+    from a previous run are not counted again.
+    """
+    files = saved = 0
+    for digest, paths in groups.items():
+        if paths[0] in skip:
+            continue
+        dest = shared_path(site_dir, digest, paths[0]) if shared else paths[0]
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.link(paths[0], dest)
+        for path in paths:
+            if not os.path.samefile(path, dest):
+                files += 1
+                saved += os.path.getsize(path)
+                tmp = path + ".dedup-tmp"
+                os.link(dest, tmp)
+                os.replace(tmp, path)
+    return files, saved
+
+
+def dedup_site(site_dir, rewrite=False):
+    """Run the dedup pass over site_dir. Returns bytes saved: in the published
+    artifact with rewrite (moved groups only), on disk otherwise."""
+    groups = collect_assets(site_dir)
+    moves = plan_moves(site_dir, groups) if rewrite else {}
+    moved_saved = sum(os.path.getsize(p) for p in moves)
+    moved_saved -= sum(os.path.getsize(paths[0]) for paths in groups.values() if paths[0] in moves)
+
+    if moves:
+        apply_rewrite(site_dir, groups, moves)
+    # Pages artifacts dereference hardlinks, so with rewrite a _shared/ copy
+    # of a group that stays in place would only add bytes.
+    linked, linked_saved = hardlink(site_dir, groups, skip=moves, shared=not rewrite)
+
+    if rewrite:
+        moved_groups = sum(1 for paths in groups.values() if paths[0] in moves)
+        print(f"✓ Deduplicated {len(groups)} distinct asset(s); {moved_groups} moved into {site_dir}/{SHARED_DIR}/")
+        print(f"  {len(moves)} copies moved, references rewritten: {moved_saved} bytes saved in the artifact")
+        print(f"  {linked} copies hardlinked in place: {linked_saved} bytes saved on disk only")
+        return moved_saved
+    print(f"✓ Deduplicated {len(groups)} distinct asset(s) into {site_dir}/{SHARED_DIR}/")
+    print(f"  {linked} copies hardlinked: {linked_saved} bytes saved on disk")
+    return linked_saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate identical assets across services in dist/.")
+    parser.add_argument("--site", default=DIST_DIR)
+    parser.add_argument("--rewrite", action="store_true",
+                        help="move stylesheets, fonts and images to _shared/ and rewrite references")
+    args = parser.parse_args()
+    dedup_site(args.site, rewrite=args.rewrite)
+
+
+if __name__ == "__main__":
+    main()
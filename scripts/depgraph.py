@@ -0,0 +1,167 @@
+"""
+Build inputs, the services that depend on them, and cached build outputs.
+
+A service's build reads its own docs_path plus any shared inputs it declares
+in docspine.yaml (or its repo entry declares in docs-registry.yaml):
+
+  shared_paths:            # also added to the sparse checkout
+    - theme                # a shared mkdocs theme directory
+    - snippets/api         # snippet includes
+    - mkdocs.base.yml      # a base config pulled in with INHERIT
+
+DepGraph maps every input to the services that read it, so a change to one
+invalidates exactly those services. Inputs are fingerprinted by hashing the
+files under them (build outputs and .git excluded), each shared input once
+per run however many services use it.
+
+A successful build's output is kept in _build/build-cache/<service>/ with the
+fingerprints it was built from. When a later run computes the same
+fingerprint the cached output is used and the build is skipped; otherwise the
+inputs that changed are reported and the service is rebuilt.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict
+
+from watcher import DEFAULT_IGNORE
+
+CACHE_DIR = os.path.join("_build", "build-cache")
+# Bump when the build environment changes in a way inputs don't capture.
+CACHE_VERSION = "2"
+
+
+class DepGraph:
+    def __init__(self):
+        self.inputs = {}                     # service root → {input label: absolute path}
+        self.dependents = defaultdict(set)   # absolute input path → service roots
+        self.outputs = set()                 # build output dirs, never inputs
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def add(self, service_root, output_dir, repo_root, shared_paths=()):
+        """Register a service, its own tree and its shared inputs (repo-relative).
+        Inputs are labelled by their repo-relative path."""
+        service_root = os.path.abspath(service_root)
+        inputs = {os.path.relpath(service_root, os.path.abspath(repo_root)).replace(os.sep, "/"): service_root}
+        for rel in shared_paths:
+            rel = rel.strip("/")
+            if rel:
+                inputs[rel] = os.path.abspath(os.path.join(repo_root, rel))
+        for path in self.inputs.get(service_root, {}).values():
+            self.dependents[path].discard(service_root)
+            if not self.dependents[path]:
+                del self.dependents[path]
+        self.inputs[service_root] = inputs
+        self.outputs.add(os.path.join(service_root, output_dir))
+        for path in inputs.values():
+            self.dependents[path].add(service_root)
+
+    def shared(self):
+        """Absolute paths of inputs outside any service's own tree."""
+        roots = set(self.inputs)
+        return sorted(p for p in self.dependents if p not in roots)
+
+    def affected(self, changed):
+        """Service roots with an input containing any of the changed paths."""
+        hit = set()
+        for path in map(os.path.abspath, changed):
+            if any(path == out or path.startswith(out + os.sep) for out in self.outputs):
+                continue
+            for inp, services in self.dependents.items():
+                if path == inp or path.startswith(inp + os.sep):
+                    hit |= services
+        return hit
+
+    def forget(self, changed):
+        """Drop memoized hashes of inputs touched by changed paths."""
+        with self._lock:
+            for inp in list(self._hashes):
+                if any(p == inp or p.startswith(inp + os.sep) for p in map(os.path.abspath, changed)):
+                    del self._hashes[inp]
+
+    def _hash_input(self, path):
+        with self._lock:
+            if path in self._hashes:
+                return self._hashes[path]
+        h = hashlib.sha256()
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in DEFAULT_IGNORE and os.path.join(root, d) not in self.outputs)
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).encode() + b"\0")
+                with open(full, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+                h.update(b"\0")
+        digest = h.hexdigest() if os.path.exists(path) else "missing"
+        with self._lock:
+            self._hashes[path] = digest
+        return digest
+
+    def fingerprint(self, service_root):
+        """(fingerprint, {input label: hash}) of a service's current inputs."""
+        hashes = {label: self._hash_input(path)
+                  for label, path in sorted(self.inputs[os.path.abspath(service_root)].items())}
+        blob = json.dumps([CACHE_VERSION, hashes], sort_keys=True).encode()
+        return hashlib.sha256(blob).hexdigest(), hashes
+
+
+# ── build output cache ──
+#
+# _build/build-cache/<service>/<fingerprint>/{site/, inputs.json}. Entries are
+# never modified once renamed into place, so concurrent runs can read one
+# while another run adds a newer one; only the newest KEEP are kept.
+
+KEEP = 2
+
+
+def _latest(service_dir):
+    try:
+        entries = [os.path.join(service_dir, e) for e in os.listdir(service_dir) if not e.endswith(".tmp")]
+    except OSError:
+        return []
+    return sorted(entries, key=os.path.getmtime, reverse=True)
+
+
+def cached_output(service_id, fingerprint, cache_dir=CACHE_DIR):
+    """The cached output dir for a service if it was built from fingerprint."""
+    site = os.path.join(cache_dir, service_id, fingerprint, "site")
+    return site if os.path.isdir(site) else None
+
+
+def changed_inputs(service_id, hashes, cache_dir=CACHE_DIR):
+    """Input labels whose hash differs from the last cached build ([] if none)."""
+    for entry in _latest(os.path.join(cache_dir, service_id)):
+        try:
+            with open(os.path.join(entry, "inputs.json")) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            continue
+        return sorted(k for k in hashes.keys() | previous.keys() if hashes.get(k) != previous.get(k))
+    return []
+
+
+def save_output(service_id, fingerprint, hashes, site_dir, cache_dir=CACHE_DIR):
+    """Cache a service's build output under its fingerprint."""
+    service_dir = os.path.join(cache_dir, service_id)
+    entry = os.path.join(service_dir, fingerprint)
+    if os.path.isdir(entry):
+        os.utime(entry)
+        return
+    tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    shutil.copytree(site_dir, os.path.join(tmp, "site"))
+    with open(os.path.join(tmp, "inputs.json"), "w") as f:
+        json.dump(hashes, f, indent=2)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp)  # a concurrent run cached the same inputs first
+    for old in _latest(service_dir)[KEEP:]:
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Computes a deployment delta for dist/ against the previous build.
+
+  diff   Hash every file in dist/, compare with the previous build's manifest
+         (a local path or the deploy-manifest.json published on the live site),
+         and write _build/delta/: delta.json (added/changed/removed),
+         manifest.json (the new path → sha256 map) and changed.tar.gz
+         holding only the added and changed files.
+  apply  Reconstruct the full site offline from a copy of the previous build
+         plus a delta directory, and verify every file against the new manifest.
+
+The new manifest is also written to dist/deploy-manifest.json so the next run
+can diff against what is actually published.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import urllib.request
+
+BASE_URL = "https://nondualworks.github.io/docspine-demo"
+DIST_DIR = "dist"
+DELTA_DIR = os.path.join("_build", "delta")
+MANIFEST_NAME = "deploy-manifest.json"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(site_dir):
+    """Map every file under site_dir (POSIX relative path) to its sha256."""
+    manifest = {}
+    for root, _, files in os.walk(site_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, site_dir).replace(os.sep, "/")
+            if rel != MANIFEST_NAME:
+                manifest[rel] = file_sha256(path)
+    return dict(sorted(manifest.items()))
+
+
+def load_previous(source):
+    """Load a previous manifest from a file path or URL; empty if unavailable."""
+    try:
+        if source.startswith(("http://", "https://")):
+            with urllib.request.urlopen(source, timeout=30) as resp:
+                return json.load(resp)
+        with open(source) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  (no previous manifest at {source}: {e}; treating every file as added)")
+        return {}
+
+
+def compute_delta(previous, current):
+    added = sorted(p for p in current if p not in previous)
+    changed = sorted(p for p in current if p in previous and previous[p] != current[p])
+    removed = sorted(p for p in previous if p not in current)
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def cmd_diff(args):
+    current = build_manifest(args.site)
+    previous = load_previous(args.previous)
+    delta = compute_delta(previous, current)
+
+    os.makedirs(args.out, exist_ok=True)
+    tar_path = os.path.join(args.out, "changed.tar.gz")
+    payload = delta["added"] + delta["changed"]
+    with tarfile.open(tar_path, "w:gz") as tar:
+        for rel in payload:
+            tar.add(os.path.join(args.site, rel), arcname=rel)
+
+    delta["files"] = len(current)
+    delta["payload_bytes"] = sum(os.path.getsize(os.path.join(args.site, p)) for p in payload)
+    with open(os.path.join(args.out, "delta.json"), "w") as f:
+        json.dump(delta, f, indent=2)
+    for target in (os.path.join(args.out, "manifest.json"), os.path.join(args.site, MANIFEST_NAME)):
+        with open(target, "w") as f:
+            json.dump(current, f, indent=2)
+
+    print(f"✓ Delta written to {args.out}/")
+    print(f"  {len(delta['added'])} added / {len(delta['changed'])} changed / "
+          f"{len(delta['removed'])} removed of {len(current)} files "
+          f"({os.path.getsize(tar_path)} bytes compressed)")
+
+
+def cmd_apply(args):
+    with open(os.path.join(args.delta, "delta.json")) as f:
+        delta = json.load(f)
+    with open(os.path.join(args.delta, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    if os.path.exists(args.out):
+        shutil.rmtree(args.out)
+    shutil.copytree(args.base, args.out)
+    for rel in delta["removed"]:
+        path = os.path.join(args.out, rel)
+        if os.path.exists(path):
+            os.remove(path)
+        # Prune directories the removal emptied, deepest first.
+        parent = os.path.dirname(path)
+        while (os.path.abspath(parent) != os.path.abspath(args.out) and os.path.isdir(parent)
+               and not os.listdir(parent)):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    with tarfile.open(os.path.join(args.delta, "changed.tar.gz")) as tar:
+        tar.extractall(args.out, filter="data")
+    with open(os.path.join(args.out, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    rebuilt = build_manifest(args.out)
+    bad = sorted(p for p in manifest.keys() | rebuilt.keys() if manifest.get(p) != rebuilt.get(p))
+    if bad:
+        for rel in bad[:20]:
+            print(f"  ✗ {rel}", file=sys.stderr)
+        print(f"✗ Reconstructed site differs from manifest in {len(bad)} file(s)", file=sys.stderr)
+        sys.exit(1)
+    print(f"✓ Site reconstructed at {args.out}/ ({len(rebuilt)} files verified)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff dist/ against the previous deployment.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    diff = sub.add_parser("diff", help="compute the delta between the previous build and dist/")
+    diff.add_argument("--site", default=DIST_DIR)
+    diff.add_argument("--previous", default=f"{BASE_URL}/{MANIFEST_NAME}",
+                      help="previous manifest path or URL (default: the live site's)")
+    diff.add_argument("--out", default=DELTA_DIR)
+    diff.set_defaults(func=cmd_diff)
+
+    apply = sub.add_parser("apply", help="rebuild a full site from a previous build plus a delta")
+    apply.add_argument("--base", required=True, help="directory holding the previous build")
+    apply.add_argument("--delta", default=DELTA_DIR)
+    apply.add_argument("--out", required=True)
+    apply.set_defaults(func=cmd_apply)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Search facets for Pagefind.
+
+Stamps every HTML page of a built service with its domain, team, service and
+Diataxis type as Pagefind filters and metadata, so the landing page can filter
+inside the index query (pagefind.search(q, {filters})) instead of fetching
+result fragments and splitting their URLs.
+
+Pages are annotated once, in a fresh build's output before it is cached and
+copied into dist/: cached builds already carry their tags (the facets come
+from docspine.yaml, which is part of the cache fingerprint), and incremental
+syncs in watch mode still compare like with like.
+"""
+import html
+import os
+import re
+
+MARKER = b"data-docspine-facets"
+
+# First URL segment below the service root → Diataxis type.
+DIATAXIS_DIRS = {
+    "tutorial": "tutorial", "tutorials": "tutorial", "getting-started": "tutorial",
+    "how-to": "how-to", "how-tos": "how-to", "howto": "how-to", "guides": "how-to",
+    "reference": "reference", "api": "reference",
+    "explanation": "explanation", "explanations": "explanation", "concepts": "explanation",
+}
+
+_META_TYPE = re.compile(rb'<meta\s+name="diataxis"\s+content="([^"]+)"', re.I)
+_BODY_END = re.compile(rb"</body\s*>", re.I)
+
+
+def page_type(rel_url, data=b""):
+    """Diataxis type of a page: an explicit <meta name="diataxis">, else its top directory."""
+    m = _META_TYPE.search(data, 0, 8192)
+    if m:
+        return m.group(1).decode("utf-8", "replace").strip().lower()
+    top = rel_url.split("/", 1)[0].lower()
+    return DIATAXIS_DIRS.get(top, "")
+
+
+def _pairs(facets):
+    # Pagefind splits attribute values on commas; escape any inside a value.
+    return ", ".join(f"{k}:{v.replace(',', chr(92) + ',')}" for k, v in facets.items() if v)
+
+
+def facet_tag(record, type_):
+    filters = {"domain": record.domain, "team": record.team, "service": record.id, "type": type_}
+    meta = {"domain": record.domain, "service": record.id, "service_name": record.name, "type": type_}
+    return (f'<span hidden data-docspine-facets data-pagefind-filter="{html.escape(_pairs(filters))}" '
+            f'data-pagefind-meta="{html.escape(_pairs(meta))}"></span>').encode()
+
+
+def annotate_site(site_dir, record):
+    """Add facet tags to every HTML page under site_dir. Returns pages annotated."""
+    count = 0
+    for root, dirs, files in os.walk(site_dir):
+        for name in files:
+            if not name.endswith(".html") or name == "404.html":
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            if MARKER in data:
+                continue
+            rel = os.path.relpath(path, site_dir).replace(os.sep, "/")
+            tag = facet_tag(record, page_type(rel, data))
+            m = None
+            for m in _BODY_END.finditer(data):
+                pass
+            data = data[:m.start()] + tag + data[m.start():] if m else data + tag
+            with open(path, "wb") as f:
+                f.write(data)
+            count += 1
+    return count
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Generates a change feed for the aggregated docs site, so consumers can poll
+one small file instead of the whole site.
+
+Changes come from the metadata store (_build/docspine.db): the page hashes
+taken while copying each service into dist/ are compared with the last
+successful build's, giving every service and page added, modified or removed.
+No extra scan of dist/ is needed. A run's changes are only recorded if it
+succeeds, so failed runs never reach the feeds and the next successful run
+still reports everything since the last published build.
+
+  dist/changes/changelog.json   what this build changed, machine-readable
+  dist/changes/atom.xml         Atom feed, one entry per build that changed
+  dist/changes/feed.json        the same as JSON Feed 1.1
+"""
+import json
+import os
+import sys
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime, timezone
+from html import escape
+
+import servicedb
+
+BASE_URL = "https://nondualworks.github.io/docspine-demo"
+DIST_DIR = "dist"
+CHANGES_DIR = "changes"
+FEED_RUNS = 20
+MAX_ITEMS = 100  # per feed entry; the changelog is never truncated
+
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def change_url(row):
+    return f"{BASE_URL}/{row['path']}/{row['url'] or ''}"
+
+
+def changelog(rows, run_id):
+    log = {
+        "run": run_id,
+        "services": {"added": [], "removed": []},
+        "pages": {"added": [], "modified": [], "removed": []},
+    }
+    for row in rows:
+        if row["url"] is None:
+            log["services"][row["change"]].append(
+                {"id": row["service_id"], "name": row["title"], "url": change_url(row)})
+        else:
+            log["pages"][row["change"]].append(
+                {"service": row["service_id"], "title": row["title"], "url": change_url(row)})
+    return log
+
+
+def entry_summary(rows):
+    counts = defaultdict(int)
+    for row in rows:
+        counts[("service" if row["url"] is None else "page", row["change"])] += 1
+    return ", ".join(f"{n} {noun}{'s' if n != 1 else ''} {change}"
+                     for (noun, change), n in sorted(counts.items(), key=lambda kv: kv[0][0] != "service"))
+
+
+def entry_html(rows):
+    items = [f'<li>{row["change"]}: <a href="{escape(change_url(row))}">{escape(row["title"])}</a>'
+             f' ({escape(row["service_id"])})</li>' for row in rows[:MAX_ITEMS]]
+    if len(rows) > MAX_ITEMS:
+        items.append(f"<li>… and {len(rows) - MAX_ITEMS} more "
+                     f'(<a href="{BASE_URL}/{CHANGES_DIR}/changelog.json">changelog</a>)</li>')
+    return "<ul>" + "".join(items) + "</ul>"
+
+
+def write_feeds(dist_dir=DIST_DIR, run_id=None):
+    with closing(servicedb.connect()) as conn:
+        if run_id is None:
+            run_id = conn.execute("SELECT MAX(id) FROM build_runs WHERE status = 'ok'").fetchone()[0]
+        run = conn.execute("SELECT started_at, status FROM build_runs WHERE id = ?", (run_id,)).fetchone()
+        # The pipeline writes feeds before its run finishes: use the changes
+        # it would record, and list it ahead of the published runs.
+        running = run is not None and run["status"] == "running"
+        rows = servicedb.pending_changes(conn, run_id) if running else servicedb.run_changes(conn, run_id)
+        log = changelog(rows, run_id)
+        entries = [(r["id"], r["started_at"], servicedb.run_changes(conn, r["id"]))
+                   for r in servicedb.runs_with_changes(conn, FEED_RUNS) if r["id"] != run_id]
+        if running and rows:
+            entries.insert(0, (run_id, run["started_at"], rows))
+        entries = entries[:FEED_RUNS]
+
+    out_dir = os.path.join(dist_dir, CHANGES_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    log["generated"] = iso(datetime.now(timezone.utc).timestamp())
+    with open(os.path.join(out_dir, "changelog.json"), "w") as f:
+        json.dump(log, f, indent=2)
+
+    updated = iso(entries[0][1]) if entries else log["generated"]
+    atom = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<feed xmlns="http://www.w3.org/2005/Atom">',
+        "  <title>Docspine Demo — documentation changes</title>",
+        f'  <link href="{BASE_URL}/"/>',
+        f'  <link rel="self" href="{BASE_URL}/{CHANGES_DIR}/atom.xml"/>',
+        f"  <id>{BASE_URL}/{CHANGES_DIR}/</id>",
+        f"  <updated>{updated}</updated>",
+    ]
+    items = []
+    for entry_run, started, rows in entries:
+        title = f"Build {entry_run}: {entry_summary(rows)}"
+        entry_id = f"{BASE_URL}/{CHANGES_DIR}/#run-{entry_run}"
+        body = entry_html(rows)
+        atom += [
+            "  <entry>",
+            f"    <title>{escape(title)}</title>",
+            f"    <id>{entry_id}</id>",
+            f"    <updated>{iso(started)}</updated>",
+            f'    <content type="html">{escape(body)}</content>',
+            "  </entry>",
+        ]
+        items.append({"id": entry_id, "title": title, "content_html": body, "date_published": iso(started)})
+    atom.append("</feed>")
+    with open(os.path.join(out_dir, "atom.xml"), "w") as f:
+        f.write("\n".join(atom) + "\n")
+    with open(os.path.join(out_dir, "feed.json"), "w") as f:
+        json.dump({
+            "version": "https://jsonfeed.org/version/1.1",
+            "title": "Docspine Demo — documentation changes",
+            "home_page_url": f"{BASE_URL}/",
+            "feed_url": f"{BASE_URL}/{CHANGES_DIR}/feed.json",
+            "items": items,
+        }, f, indent=2)
+
+    pages = log["pages"]
+    print(f"✓ Change feed generated at {out_dir}/ ({len(pages['added'])} added / "
+          f"{len(pages['modified'])} modified / {len(pages['removed'])} removed pages this build)")
+
+
+def main():
+    if not servicedb.exists():
+        print(f"✗ {servicedb.DB_PATH} not found; run scripts/aggregate.py first", file=sys.stderr)
+        sys.exit(1)
+    write_feeds()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,253 @@
 #!/usr/bin/env python3
 """
-Generates dist/index.html from _build/services.json.
+Generates dist/index.html from the service metadata store (_build/docspine.db),
+falling back to _build/services.json.
 Renders the full "Engineering Editorial" landing page with
 Bookshelf Spines (default) and Hex Grid themes, Pagefind search,
 Diataxis filter pills, and a theme switcher.
+
+The page makes no third-party requests. Its webfonts are downloaded from
+Google Fonts at build time (cached in _build/font-cache/), cut down to the
+Latin subset (further subsetted with fontTools when installed), written to
+dist/fonts/ under content-hashed names, and preloaded. The Pagefind runtime
+and index metadata are fetched once the page is idle or the search box gets
+focus, so the first keystroke does not wait on them.
+
+Once the site is assembled and indexed, --service-worker (the pipeline's sw
+stage) writes dist/sw.js. It precaches the landing page, its fonts, the
+_shared/ theme assets and the Pagefind runtime and metadata under a version
+hashed from the site's file manifest, leaving out build timestamps (the
+feeds, the landing page's build date). Service docs are served
+stale-while-revalidate. A build that changes content changes the version, and
+the caches of older versions are dropped once the new worker activates; a
+rebuild of unchanged content keeps them. Repeat visits load from cache and
+keep working offline.
 """
+import argparse
+import hashlib
+import io
 import json
 import os
+import re
+import urllib.request
 from collections import defaultdict
 from datetime import datetime, timezone
 
+from model import load_services
 
-SERVICES_JSON = os.path.join("_build", "services.json")
-DIST_DIR = "dist"
+try:
+    from fontTools import subset as fontsubset
+    from fontTools.ttLib import TTFont
+except ImportError:
+    fontsubset = None
 
 
-def load_services():
-    with open(SERVICES_JSON) as f:
-        return json.load(f)
+DIST_DIR = "dist"
+STATS_JSON = os.path.join("_build", "stats.json")
+# Shelf order for known domains; any others follow in registry order.
+DOMAIN_ORDER = ("checkout", "identity", "platform", "observability")
+DIATAXIS_TYPES = ("tutorial", "how-to", "reference", "explanation")
+FONTS_DIR = "fonts"
+FONT_CACHE = os.path.join("_build", "font-cache")
+FONTS_CSS_URL = (
+    "https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;500;600"
+    "&family=Fraunces:ital,opsz,wght@0,9..144,300;0,9..144,400;0,9..144,600;0,9..144,700;1,9..144,400"
+    "&family=DM+Sans:wght@400;500;600;700&display=swap"
+)
+# Google Fonts only serves woff2 split by unicode-range to browsers it knows.
+FONTS_USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+FONT_SUBSETS = {"latin"}
+# Faces used above the fold; the other weights load when first used.
+FONT_PRELOAD = {("DM Sans", "normal", "400"), ("Fraunces", "normal", "400"),
+                ("JetBrains Mono", "normal", "400")}
+FONT_FEATURES = ["kern", "liga", "calt", "ccmp", "locl", "mark", "mkmk", "tnum"]
+# Bump when subsetting settings change to invalidate cached fonts.
+FONT_CACHE_VERSION = "1"
+SW_NAME = "sw.js"
+# Theme stylesheets and fonts from _shared/ are precached up to this size;
+# everything else is cached as it is visited.
+SW_SHARED_EXTS = (".css", ".woff2")
+SW_SHARED_BUDGET = 2 * 1024 * 1024
+SW_RUNTIME_ENTRIES = 300
+# Rewritten with the build time on every run; not part of the cache version.
+SW_UNVERSIONED = ("changes/",)
+
+_FACE = re.compile(r"/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*\{[^}]*\})")
+_FACE_PROP = re.compile(r"(font-family|font-style|font-weight|unicode-range):\s*'?([^';]+)'?;")
+_FACE_URL = re.compile(r"url\(([^)]+)\)")
+
+
+def cached_fetch(url, cache_dir, transform=None, tag="raw"):
+    """Fetch url once; later builds (and offline ones) read _build/font-cache/."""
+    key = hashlib.sha256(f"{FONT_CACHE_VERSION} {tag} {url}".encode()).hexdigest()
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    if transform:
+        data = transform(cached_fetch(url, cache_dir))
+    else:
+        req = urllib.request.Request(url, headers={"User-Agent": FONTS_USER_AGENT})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            data = resp.read()
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return data
+
+
+def unicode_range(value):
+    """Code points of a CSS unicode-range value."""
+    codepoints = set()
+    for part in value.replace("U+", "").replace("u+", "").split(","):
+        lo, _, hi = part.strip().partition("-")
+        if "?" in lo:
+            lo, hi = lo.replace("?", "0"), lo.replace("?", "F")
+        codepoints.update(range(int(lo, 16), int(hi or lo, 16) + 1))
+    return codepoints
+
+
+def subset_font(data, codepoints):
+    """Keep only the given code points and the layout features the page uses."""
+    if fontsubset is None:
+        return data
+    options = fontsubset.Options()
+    options.flavor = "woff2"
+    options.layout_features = FONT_FEATURES
+    options.hinting = False
+    options.desubroutinize = True
+    try:
+        font = TTFont(io.BytesIO(data))
+        subsetter = fontsubset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font.flavor = "woff2"
+        font.save(out)
+    except Exception as e:  # e.g. no brotli for woff2: ship Google's subset as is
+        print(f"  → Font subsetting skipped ({e})")
+        return data
+    return out.getvalue() if len(out.getvalue()) < len(data) else data
+
+
+def self_host_fonts(dist_dir=DIST_DIR, cache_dir=FONT_CACHE):
+    """Write the landing page fonts to dist/fonts/.
+    Returns (@font-face CSS, hrefs to preload); both empty when the fonts are
+    neither cached nor downloadable, and the page falls back to system fonts.
+    """
+    try:
+        css = cached_fetch(FONTS_CSS_URL, cache_dir).decode()
+    except OSError as e:
+        print(f"  → Webfonts unavailable ({e}); using system font fallbacks")
+        return "", []
+
+    out_dir = os.path.join(dist_dir, FONTS_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    faces, preloads, written, total = [], [], {}, 0
+    for subset, face in _FACE.findall(css):
+        if subset not in FONT_SUBSETS:
+            continue
+        props = dict(_FACE_PROP.findall(face))
+        url = _FACE_URL.search(face).group(1)
+        if url not in written:
+            codepoints = unicode_range(props["unicode-range"])
+            try:
+                if fontsubset:
+                    data = cached_fetch(url, cache_dir, lambda d: subset_font(d, codepoints), tag="subset")
+                else:
+                    data = cached_fetch(url, cache_dir)
+            except OSError as e:
+                print(f"  → Webfont {url} unavailable ({e}); using system font fallbacks")
+                return "", []
+            name = f"{hashlib.sha256(data).hexdigest()[:16]}.woff2"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(data)
+            written[url] = f"{FONTS_DIR}/{name}"
+            total += len(data)
+        href = written[url]
+        faces.append(face.replace(url, href))
+        key = (props["font-family"].strip(), props["font-style"].strip(), props["font-weight"].strip())
+        if key in FONT_PRELOAD and href not in preloads:
+            preloads.append(href)
+    print(f"  ✓ {len(written)} font file(s) self-hosted in {out_dir}/ ({total // 1024} KiB"
+          + (")" if fontsubset else ", fontTools not installed: Google's Latin subset as is)"))
+    return "\n".join(faces), preloads
 
 
 def compute_stats(services):
-    total_pages = sum(s.get("pages", 0) for s in services)
-    teams = len({s["team"] for s in services if s.get("team")})
-    domains = len({s["domain"] for s in services if s.get("domain")})
-    last_build = datetime.now(timezone.utc).strftime("%b %-d, %Y")
-    return len(services), teams, domains, total_pages, last_build
-
-
-def main():
-    services = load_services()
-    svc_count, team_count, domain_count, page_count, last_build = compute_stats(services)
-
-    services_json_inline = json.dumps(services)
+    """Every aggregate the landing page shows, in one pass over the services.
+
+    Domains and teams come back as lists of rows (domain order: DOMAIN_ORDER,
+    then first appearance), each with its service indices into `services`
+    (registry order, as in _build/services.json), page total and a Diataxis
+    coverage row: how many of its services cover each type in
+    `diataxis_types`.
+    """
+    types = list(DIATAXIS_TYPES)
+    domains, teams = {}, {}
+    pages = max_pages = 0
+    for i, svc in enumerate(services):
+        pages += svc.pages
+        max_pages = max(max_pages, svc.pages or 1)
+        for t in svc.diataxis:
+            if t not in types:
+                types.append(t)
+        rows = [domains.setdefault(svc.domain, {"name": svc.domain, "services": [], "pages": 0,
+                                                "teams": set(), "coverage": defaultdict(int)})]
+        rows[0]["teams"].add(svc.team)
+        if svc.team:
+            rows.append(teams.setdefault(svc.team, {"name": svc.team, "services": [], "pages": 0,
+                                                    "domains": set(), "coverage": defaultdict(int)}))
+            rows[1]["domains"].add(svc.domain)
+        for row in rows:
+            row["services"].append(i)
+            row["pages"] += svc.pages
+            for t in svc.diataxis:
+                row["coverage"][t] += 1
+
+    def finish(row, counted):
+        row[counted] = len(row[counted] - {""})
+        row["coverage"] = [row["coverage"][t] for t in types]
+        return row
+
+    rank = {d: i for i, d in enumerate(DOMAIN_ORDER)}
+    ordered = sorted(domains.values(), key=lambda r: rank.get(r["name"], len(rank)))
+    return {
+        "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "last_build": datetime.now(timezone.utc).strftime("%b %-d, %Y"),
+        "services": len(services),
+        "teams": len(teams),
+        "domains": len(domains),
+        "pages": pages,
+        "max_pages": max_pages,
+        "diataxis_types": types,
+        "coverage": [sum(r["coverage"][t] for r in domains.values()) for t in types],
+        "by_domain": [finish(r, "teams") for r in ordered],
+        "by_team": [finish(teams[t], "domains") for t in sorted(teams)],
+    }
+
+
+def write_stats(stats, path=STATS_JSON):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp, path)
+
+
+def render_landing(services, font_css="", font_preloads=(), stats=None):
+    """Render the landing page for a list of service records. Returns the HTML."""
+    stats = stats or compute_stats(services)
+    svc_count, team_count, domain_count, page_count, last_build = (
+        stats["services"], stats["teams"], stats["domains"], stats["pages"], stats["last_build"])
+
+    services_json_inline = json.dumps([s.to_record() for s in services])
+    stats_json_inline = json.dumps(stats)
+    font_links = "".join(f'<link rel="preload" href="{href}" as="font" type="font/woff2" crossorigin>\n'
+                         for href in font_preloads)
 
     html = f"""<!DOCTYPE html>
 <html lang="en">
@@ -40,9 +255,8 @@ def main():
 <meta charset="utf-8">
 <meta name="viewport" content="width=device-width, initial-scale=1">
 <title>Docspine Demo — Documentation Hub</title>
-<link rel="preconnect" href="https://fonts.googleapis.com">
-<link href="https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;500;600&family=Fraunces:ital,opsz,wght@0,9..144,300;0,9..144,400;0,9..144,600;0,9..144,700;1,9..144,400&family=DM+Sans:wght@400;500;600;700&display=swap" rel="stylesheet">
-<style>
+{font_links}<style>
+{font_css}
   :root {{
     --bg-primary: #1e2028;
     --bg-secondary: #252930;
@@ -1004,6 +1218,8 @@ def main():
 <script>
 // ═══════ Service data (injected at build time) ═══════
 const SERVICES = {services_json_inline};
+// Aggregates computed once by the generator (also in _build/stats.json).
+const STATS = {stats_json_inline};
 
 const DT_COLORS = {{
   'how-to': 'var(--dt-howto)',
@@ -1012,8 +1228,6 @@ const DT_COLORS = {{
   'tutorial': 'var(--dt-tutorial)'
 }};
 
-const DOMAIN_ORDER = ['checkout', 'identity', 'platform', 'observability'];
-
 // ═══════ Hex abbreviation (auto-derived) ═══════
 function abbrev(id) {{
   const words = id.split('-');
@@ -1076,17 +1290,16 @@ colorToggle.addEventListener('click', () => {{
 // ═══════ Build bookshelf ═══════
 function buildBookshelf() {{
   const bookshelf = document.getElementById('bookshelf');
-  const maxPages = Math.max(...SERVICES.map(s => s.pages || 1));
-  const domains = DOMAIN_ORDER.filter(d => SERVICES.some(s => s.domain === d));
+  const maxPages = STATS.max_pages;
 
   let html = '';
-  domains.forEach(domain => {{
-    const svcs = SERVICES.filter(s => s.domain === domain);
+  STATS.by_domain.forEach(({{ name: domain, services }}) => {{
     html += `<div class="shelf-row domain-${{domain}}">`;
     html += `<div class="shelf-domain-label">${{domain}}</div>`;
     html += `<div class="shelf-surface">`;
 
-    svcs.forEach(svc => {{
+    services.forEach(index => {{
+      const svc = SERVICES[index];
       const height = 120 + ((svc.pages || 1) / maxPages) * 100;
       const width = 44 + (svc.id.length % 3) * 4;
       const notchCount = Math.min(svc.pages || 0, 6);
@@ -1098,7 +1311,7 @@ function buildBookshelf() {{
       }});
 
       html += `
-        <div class="spine" data-service="${{svc.id}}" data-domain="${{domain}}" style="height:${{height}}px;width:${{width}}px">
+        <div class="spine" data-index="${{index}}" data-service="${{svc.id}}" data-domain="${{domain}}" data-path="${{svc.path}}" style="height:${{height}}px;width:${{width}}px">
           <div class="spine-diataxis">${{pips}}</div>
           <div class="spine-title">${{svc.name}}</div>
           <div class="spine-team">${{svc.team}}</div>
@@ -1122,16 +1335,14 @@ function buildBookshelf() {{
 // ═══════ Build hex catalog ═══════
 function buildHexCatalog() {{
   const grid = document.getElementById('domainsGrid');
-  const domains = DOMAIN_ORDER.filter(d => SERVICES.some(s => s.domain === d));
-
   let html = '';
-  domains.forEach(domain => {{
-    const svcs = SERVICES.filter(s => s.domain === domain);
+  STATS.by_domain.forEach(({{ name: domain, services }}) => {{
     html += `<div class="domain-column domain-${{domain}}">`;
     html += `<div class="domain-header">${{domain}}</div>`;
     html += `<div class="hex-stack">`;
 
-    svcs.forEach(svc => {{
+    services.forEach(index => {{
+      const svc = SERVICES[index];
       const ab = abbrev(svc.id);
       let dots = '';
       (svc.diataxis || []).forEach(dt => {{
@@ -1139,7 +1350,7 @@ function buildHexCatalog() {{
       }});
 
       html += `
-        <div class="hex-wrapper" data-service="${{svc.id}}" data-domain="${{domain}}">
+        <div class="hex-wrapper" data-index="${{index}}" data-service="${{svc.id}}" data-domain="${{domain}}" data-path="${{svc.path}}">
           <div class="hex-shape">
             <div class="hex-abbr">${{ab}}</div>
             <div class="hex-name">${{svc.name}}</div>
@@ -1174,15 +1385,30 @@ const hexCatalog = document.getElementById('hexCatalog');
 let activeFilter = 'all';
 let selectedIndex = -1;
 let pagefind = null;
+let pagefindLoading = null;
 
-async function loadPagefind() {{
-  if (pagefind) return;
-  try {{
-    pagefind = await import('./pagefind/pagefind.js');
-    await pagefind.init();
-  }} catch (e) {{
-    pagefind = null;
+// Shared by the idle prefetch, search focus and the first search, so the
+// runtime and index metadata are only fetched once.
+function loadPagefind() {{
+  if (!pagefindLoading) {{
+    pagefindLoading = import('./pagefind/pagefind.js')
+      .then(async pf => {{ await pf.init(); pagefind = pf; }})
+      .catch(() => {{ pagefindLoading = null; }});
   }}
+  return pagefindLoading;
+}}
+
+if (!navigator.connection?.saveData) {{
+  (window.requestIdleCallback || (cb => setTimeout(cb, 2000)))(() => loadPagefind());
+}}
+searchInput.addEventListener('focus', () => loadPagefind(), {{ once: true }});
+
+// sw.js precaches this page and the search metadata for instant, offline
+// repeat visits; it only exists in full builds.
+if ('serviceWorker' in navigator) {{
+  window.addEventListener('load', () => {{
+    navigator.serviceWorker.register('./{SW_NAME}').catch(() => {{}});
+  }});
 }}
 
 function hideCatalog() {{
@@ -1203,13 +1429,13 @@ function highlight(text, query) {{
 
 function filterCatalog() {{
   document.querySelectorAll('.spine').forEach(el => {{
-    const svc = SERVICES.find(s => s.id === el.dataset.service);
+    const svc = SERVICES[el.dataset.index];
     if (!svc) return;
     const match = activeFilter === 'all' || (svc.diataxis || []).includes(activeFilter);
     el.classList.toggle('spine-dimmed', !match);
   }});
   document.querySelectorAll('.hex-wrapper').forEach(el => {{
-    const svc = SERVICES.find(s => s.id === el.dataset.service);
+    const svc = SERVICES[el.dataset.index];
     if (!svc) return;
     const match = activeFilter === 'all' || (svc.diataxis || []).includes(activeFilter);
     el.classList.toggle('hex-dimmed', !match);
@@ -1237,32 +1463,25 @@ async function doSearch() {{
 
   if (pagefind) {{
     try {{
-      const search = await pagefind.search(query);
+      // Facets are stamped on each page at build time (scripts/facets.py), so the
+      // Diataxis filter is applied inside the index before any fragment loads.
+      const filters = activeFilter === 'all' ? {{}} : {{ type: activeFilter }};
+      const search = await pagefind.search(query, {{ filters }});
       const raw = await Promise.all(search.results.slice(0, 30).map(r => r.data()));
-      results = raw.map(r => {{
-        const segs = (r.url || '').replace(/^\\//, '').split('/');
-        const domain = segs[0] || '';
-        const service = segs[1] || '';
-        const type = segs[2] || 'reference';
-        return {{
-          title: r.meta?.title || r.url,
-          type,
-          domain,
-          service,
-          path: r.url,
-          desc: r.excerpt || '',
-          fromPagefind: true,
-        }};
-      }});
+      results = raw.map(r => ({{
+        title: r.meta?.title || r.url,
+        type: r.meta?.type || '',
+        domain: r.meta?.domain || 'other',
+        service: r.meta?.service || '',
+        path: r.url,
+        desc: r.excerpt || '',
+        fromPagefind: true,
+      }}));
     }} catch (e) {{
       // pagefind failed, fall through to empty
     }}
   }}
 
-  if (activeFilter !== 'all') {{
-    results = results.filter(r => r.type === activeFilter);
-  }}
-
   if (results.length === 0) {{
     searchResults.classList.remove('visible');
     searchResults.innerHTML = '';
@@ -1284,9 +1503,9 @@ async function doSearch() {{
     html += `<div class="results-domain-group" style="animation-delay:${{idx * 0.04}}s">`;
     html += `<div class="results-domain-label">${{domain}} · ${{docs.length}} result${{docs.length > 1 ? 's' : ''}}</div>`;
     docs.forEach(d => {{
-      const badge = d.type.replace(/_/g, '-');
+      const badge = d.type ? `<span class="result-badge badge-${{d.type.replace(/_/g, '-')}}">${{d.type}}</span>` : '';
       html += `<a class="result-item" href="${{d.path}}" data-idx="${{idx}}">
-        <span class="result-badge badge-${{badge}}">${{d.type}}</span>
+        ${{badge}}
         <div class="result-content">
           <h4>${{highlight(d.title, query)}}</h4>
           <p>${{d.desc}}</p>
@@ -1345,11 +1564,11 @@ document.addEventListener('keydown', (e) => {{
 document.addEventListener('click', (e) => {{
   const spine = e.target.closest('.spine');
   if (spine) {{
-    window.location.href = spine.dataset.domain + '/' + spine.dataset.service + '/';
+    window.location.href = spine.dataset.path + '/';
   }}
   const hex = e.target.closest('.hex-wrapper');
   if (hex) {{
-    window.location.href = hex.dataset.domain + '/' + hex.dataset.service + '/';
+    window.location.href = hex.dataset.path + '/';
   }}
 }});
 </script>
@@ -1357,13 +1576,203 @@ document.addEventListener('click', (e) => {{
 </body>
 </html>
 """
+    return html
+
+
+def write_landing(services, dist_dir=DIST_DIR, stats_json=STATS_JSON):
+    stats = compute_stats(services)
+    html = render_landing(services, *self_host_fonts(dist_dir), stats=stats)
+    write_stats(stats, stats_json)
 
-    os.makedirs(DIST_DIR, exist_ok=True)
-    out = os.path.join(DIST_DIR, "index.html")
+    os.makedirs(dist_dir, exist_ok=True)
+    out = os.path.join(dist_dir, "index.html")
     with open(out, "w") as f:
         f.write(html)
-    print(f"✓ Landing page generated at {out}")
-    print(f"  {svc_count} services / {team_count} teams / {domain_count} domains / {page_count} pages")
+    print(f"✓ Landing page generated at {out} (aggregates in {stats_json})")
+    print(f"  {stats['services']} services / {stats['teams']} teams / {stats['domains']} domains / "
+          f"{stats['pages']} pages")
+
+
+SW_TEMPLATE = """\
+// Generated by scripts/generate-landing-page.py --service-worker.
+const VERSION = __VERSION__;
+const PRECACHE = __PRECACHE__;
+const MAX_RUNTIME_ENTRIES = __MAX_RUNTIME__;
+const SHELL_CACHE = `docspine-shell-${VERSION}`;
+const RUNTIME_CACHE = `docspine-docs-${VERSION}`;
+const SCOPE = new URL('./', self.location).href;
+// Content-hashed: a URL's bytes never change, so the cache always wins.
+const IMMUTABLE = /^(?:fonts|_shared|pagefind\\/(?:index|fragment|filter))\\//;
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then(cache => cache.addAll(PRECACHE))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys
+        .filter(k => k.startsWith('docspine-') && k !== SHELL_CACHE && k !== RUNTIME_CACHE)
+        .map(k => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+async function trim(cache) {
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_RUNTIME_ENTRIES)).map(k => cache.delete(k)));
+}
+
+async function put(request, response) {
+  if (!response.ok || response.type !== 'basic') return;
+  const cache = await caches.open(RUNTIME_CACHE);
+  await cache.put(request, response);
+  await trim(cache);
+}
+
+async function cacheFirst(request) {
+  const cached = await caches.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  put(request, response.clone());
+  return response;
+}
+
+async function staleWhileRevalidate(event) {
+  const request = event.request;
+  const cached = await caches.match(request, { ignoreSearch: request.mode === 'navigate' });
+  const network = fetch(request).then(response => {
+    event.waitUntil(put(request, response.clone()));
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  try {
+    return await network;
+  } catch (err) {
+    // Offline and never visited: fall back to the landing page for pages.
+    const shell = request.mode === 'navigate' && await caches.match(SCOPE);
+    if (shell) return shell;
+    throw err;
+  }
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET' || !request.url.startsWith(SCOPE)) return;
+  const path = request.url.slice(SCOPE.length).split(/[?#]/)[0];
+  if (path === '' || path === 'index.html') {
+    // The landing shell is versioned with the worker: serve it from the precache.
+    event.respondWith(caches.match(SCOPE).then(r => r || fetch(request)));
+  } else if (IMMUTABLE.test(path)) {
+    event.respondWith(cacheFirst(request));
+  } else {
+    event.respondWith(staleWhileRevalidate(event));
+  }
+});
+"""
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def site_manifest(dist_dir):
+    """Map every file under dist_dir (POSIX relative path) to its sha256,
+    leaving out the service worker and compressed siblings."""
+    manifest = {}
+    for root, dirs, files in os.walk(dist_dir):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, dist_dir).replace(os.sep, "/")
+            if rel != SW_NAME and not name.endswith((".gz", ".br")):
+                manifest[rel] = _file_sha256(full)
+    return manifest
+
+
+_STATS = re.compile(rb"const STATS = (\{.*?\});\n")
+
+
+def cache_version(dist_dir, manifest):
+    """Hash of the site's content for the service worker's cache names.
+    Files in SW_UNVERSIONED are left out and the landing page is hashed with
+    its build timestamps removed, so only a content change starts a new
+    version."""
+    hashed = {rel: h for rel, h in manifest.items() if not rel.startswith(SW_UNVERSIONED)}
+    if "index.html" in hashed:
+        with open(os.path.join(dist_dir, "index.html"), "rb") as f:
+            data = f.read()
+        m = _STATS.search(data)
+        stats = json.loads(m.group(1)) if m else {}
+        for key in ("generated", "last_build"):
+            if stats.get(key):
+                data = data.replace(stats[key].encode(), b"")
+        hashed["index.html"] = hashlib.sha256(data).hexdigest()
+    return hashlib.sha256(json.dumps(hashed, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def precache_urls(dist_dir, manifest):
+    """Relative URLs the service worker caches on install: the landing page,
+    its fonts, _shared/ theme assets within SW_SHARED_BUDGET, and the
+    Pagefind runtime, entry file, metadata and wasm for each language."""
+    urls = ["./"]
+    urls += [rel for rel in manifest if rel.startswith(f"{FONTS_DIR}/")]
+    budget = SW_SHARED_BUDGET
+    for rel in manifest:
+        if rel.startswith("_shared/") and rel.endswith(SW_SHARED_EXTS):
+            size = os.path.getsize(os.path.join(dist_dir, *rel.split("/")))
+            if size <= budget:
+                urls.append(rel)
+                budget -= size
+    try:
+        with open(os.path.join(dist_dir, "pagefind", "pagefind-entry.json")) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return urls
+    wanted = {"pagefind/pagefind.js", "pagefind/pagefind-worker.js", "pagefind/pagefind-entry.json"}
+    for lang in entry.get("languages", {}).values():
+        wanted.add(f"pagefind/pagefind.{lang['hash']}.pf_meta")
+        wanted.add(f"pagefind/wasm.{lang.get('wasm') or 'unknown'}.pagefind")
+    return urls + sorted(wanted & manifest.keys())
+
+
+def write_service_worker(dist_dir=DIST_DIR):
+    """Write dist/sw.js for the assembled, indexed site."""
+    manifest = site_manifest(dist_dir)
+    version = cache_version(dist_dir, manifest)
+    urls = precache_urls(dist_dir, manifest)
+    js = (SW_TEMPLATE.replace("__VERSION__", json.dumps(version))
+          .replace("__PRECACHE__", json.dumps(urls, indent=2))
+          .replace("__MAX_RUNTIME__", str(SW_RUNTIME_ENTRIES)))
+    out = os.path.join(dist_dir, SW_NAME)
+    tmp = f"{out}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(js)
+    os.replace(tmp, out)
+    print(f"✓ Service worker written to {out} (version {version}, {len(urls)} precached URL(s))")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the landing page.")
+    parser.add_argument("--service-worker", action="store_true",
+                        help=f"only write {DIST_DIR}/{SW_NAME} for the current {DIST_DIR}/ (run after Pagefind)")
+    args = parser.parse_args()
+    if args.service_worker:
+        write_service_worker()
+    else:
+        write_landing(load_services())
 
 
 if __name__ == "__main__":
@@ -1,72 +1,137 @@
 #!/usr/bin/env python3
 """
-Generates dist/llms.txt for the aggregated docs site.
-Reads from _build/services.json (written by aggregate.py).
-Falls back to parsing docs-registry.yaml directly for local runs before aggregation.
+Generates llms.txt files for the aggregated docs site.
+Reads services and their pages from the metadata store (_build/docspine.db,
+written by aggregate.py), falling back to _build/services.json and scanning
+dist/ for pages.
+
+Output is hierarchical so LLM agents can fetch only what they need:
+
+  dist/llms.txt                      root index: one line per domain
+  dist/llms/<domain>.txt             services in a domain
+  dist/llms/<domain>/<service>.txt   pages of one service (skipped when the
+                                     service ships its own llms.txt)
+
+Service URLs come from each record's `path`, routed by routing.py from the
+registry's URL template, so they match where the service was actually copied.
+<domain> and <service> are slugged the same way routing.py slugs URL
+segments. Every file is capped at a byte budget; longer listings continue in
+numbered parts (<name>-2.txt, ...) linked from the end of the previous part.
+Files from an earlier build, parts included, are removed before writing.
 """
-import json
+import glob
 import os
-import yaml
+import shutil
 from collections import defaultdict
+from contextlib import closing
+
+import routing
+import servicedb
+from model import load_pages, load_services
 
 BASE_URL = "https://nondualworks.github.io/docspine-demo"
-SERVICES_JSON = os.path.join("_build", "services.json")
-REGISTRY_FILE = "docs-registry.yaml"
-
-
-def load_services():
-    if os.path.exists(SERVICES_JSON):
-        with open(SERVICES_JSON) as f:
-            return json.load(f)
-
-    # Fallback: derive service list from docs-registry.yaml
-    # This only has id/domain stubs — no team or page count
-    print(f"  (services.json not found, falling back to {REGISTRY_FILE})")
-    with open(REGISTRY_FILE) as f:
-        registry = yaml.safe_load(f)
-
-    services = []
-    for repo_entry in registry.get("repos", []):
-        for svc_entry in repo_entry.get("services", []):
-            docs_path = svc_entry["docs_path"]
-            services.append({
-                "id": docs_path,
-                "name": docs_path.replace("-", " ").title(),
-                "domain": "",
-                "team": "",
-                "pages": 0,
-                "diataxis": [],
-            })
-    return services
+DIST_DIR = "dist"
+LLMS_DIR = "llms"
+MAX_BYTES = 50_000
 
 
-def main():
-    dist_dir = "dist"
-    services = load_services()
+def capped_files(name, header, entries, max_bytes):
+    """Split header + entries into files of at most max_bytes each.
+    Returns [(relative file name, content)]; parts after the first are
+    name-2.txt, name-3.txt, ... and each part links to the next.
+    """
+    budget = max_bytes - 64  # room for the trailing "More" link
+    parts, current = [], list(header)
+    size = sum(len(line.encode()) + 1 for line in current)
+    for entry in entries:
+        n = len(entry.encode()) + 1
+        if size + n > budget and len(current) > len(header):
+            parts.append(current)
+            current = list(header) + [f"(continued, part {len(parts) + 1})", ""]
+            size = sum(len(line.encode()) + 1 for line in current)
+        current.append(entry)
+        size += n
+    parts.append(current)
+
+    files = []
+    for i, lines in enumerate(parts):
+        fname = f"{name}.txt" if i == 0 else f"{name}-{i + 1}.txt"
+        if i + 1 < len(parts):
+            nxt = f"{os.path.basename(name)}-{i + 2}.txt"
+            lines = lines + ["", f"- [More]({nxt})"]
+        files.append((fname, "\n".join(lines) + "\n"))
+    return files
+
+
+def segment(value):
+    """A path segment for value, safe in file names and URLs."""
+    return routing.slug(value) or "unnamed"
+
+
+def build_llms_files(services, dist_dir=DIST_DIR, max_bytes=MAX_BYTES, conn=None):
+    """Return {path relative to dist_dir: content} for every llms file."""
+    files = {}
+    groups = defaultdict(list)
+    for svc in services:
+        groups[svc.domain].append(svc)
+
+    root_entries = []
+    for domain in sorted(groups):
+        svcs = groups[domain]
+        domain_base = f"{LLMS_DIR}/{segment(domain)}"
+        domain_entries = []
+        for svc in svcs:
+            name, path = svc.name, svc.path
+            url = f"{BASE_URL}/{path}/"
+            service_dir = os.path.join(dist_dir, *path.split("/"))
+            if os.path.exists(os.path.join(service_dir, "llms.txt")):
+                detail = f"{BASE_URL}/{path}/llms.txt"
+            else:
+                base = f"{domain_base}/{segment(svc.id)}"
+                header = [f"# {name}", f"> {svc.team or domain} · {url}", ""]
+                pages = [f"- [{p.title}]({url}{p.url})" for p in load_pages(svc, service_dir, conn)]
+                for fname, content in capped_files(base, header, pages, max_bytes):
+                    files[fname] = content
+                detail = f"{BASE_URL}/{base}.txt"
+            meta = ", ".join(filter(None, [svc.team, f"{svc.pages} pages", "/".join(svc.diataxis)]))
+            domain_entries.append(f"- [{name}]({url}): {meta} — [pages]({detail})")
 
-    lines = [
+        header = [f"# {domain.title()} — Docspine Demo", f"> {len(svcs)} service(s).", ""]
+        for fname, content in capped_files(domain_base, header, domain_entries, max_bytes):
+            files[fname] = content
+        root_entries.append(f"- [{domain.title()}]({BASE_URL}/{domain_base}.txt): {len(svcs)} service(s)")
+
+    header = [
         "# Docspine Demo — Documentation Hub",
         "> Aggregated documentation for registered services. Built with Docspine.",
+        "> Each domain links to its own llms file listing services and their pages.",
         "",
     ]
+    for fname, content in capped_files("llms", header, root_entries, max_bytes):
+        files[fname] = content
+    return files
 
-    groups = defaultdict(list)
-    for svc in services:
-        groups[svc.get("domain") or "other"].append(svc)
-
-    for domain in sorted(groups.keys()):
-        lines.append(f"## {domain.title()}")
-        for svc in groups[domain]:
-            name = svc.get("name") or svc["id"]
-            url = f"{BASE_URL}/{domain}/{svc['id']}/"
-            lines.append(f"- [{name}]({url})")
-        lines.append("")
-
-    os.makedirs(dist_dir, exist_ok=True)
-    out = os.path.join(dist_dir, "llms.txt")
-    with open(out, "w") as f:
-        f.write("\n".join(lines))
-    print(f"✓ llms.txt generated at {out} ({len(services)} services)")
+
+def write_llms(services, dist_dir=DIST_DIR, max_bytes=MAX_BYTES):
+    if servicedb.exists():
+        with closing(servicedb.connect()) as conn:
+            files = build_llms_files(services, dist_dir, max_bytes, conn)
+    else:
+        files = build_llms_files(services, dist_dir, max_bytes)
+    shutil.rmtree(os.path.join(dist_dir, LLMS_DIR), ignore_errors=True)
+    for stale in glob.glob(os.path.join(dist_dir, "llms-*.txt")):
+        os.remove(stale)
+    for rel, content in files.items():
+        out = os.path.join(dist_dir, rel)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "w") as f:
+            f.write(content)
+    print(f"✓ llms.txt generated at {os.path.join(dist_dir, 'llms.txt')} "
+          f"({len(services)} services, {len(files)} files)")
+
+
+def main():
+    write_llms(load_services())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Generates sitemap.xml and robots.txt for the aggregated docs site.
+
+Pages are streamed from the metadata store (_build/docspine.db) one row at a
+time and written straight out, so memory use does not grow with the site:
+
+  dist/sitemap.xml               sitemap index, one entry per chunk
+  dist/sitemaps/sitemap-N.xml    at most 50,000 URLs / 50 MB each
+  dist/robots.txt                allows everything, points at the index
+
+Each URL's <lastmod> is the commit date of its service's upstream repo, so
+crawlers can skip services that have not changed. Without the store, pages are
+found by scanning dist/ and carry no lastmod.
+"""
+import os
+import shutil
+import sys
+from contextlib import closing
+from xml.sax.saxutils import escape
+
+import servicedb
+from model import load_services
+
+BASE_URL = "https://nondualworks.github.io/docspine-demo"
+DIST_DIR = "dist"
+SITEMAPS_DIR = "sitemaps"
+MAX_URLS = 50_000
+MAX_BYTES = 50 * 1024 * 1024
+
+URLSET_OPEN = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+URLSET_CLOSE = "</urlset>\n"
+
+
+def iter_pages(dist_dir):
+    """Yield (absolute URL, lastmod or None) for the landing page and every service page."""
+    yield f"{BASE_URL}/", None
+    if servicedb.exists():
+        with closing(servicedb.connect()) as conn:
+            for path, url, committed_at in servicedb.iter_published_pages(conn):
+                yield f"{BASE_URL}/{path}/{url}", committed_at
+        return
+    for svc in load_services():
+        service_dir = os.path.join(dist_dir, *svc.path.split("/"))
+        for url, _, _ in servicedb.scan_pages(service_dir):
+            yield f"{BASE_URL}/{svc.path}/{url}", None
+
+
+class ChunkWriter:
+    """Write <url> entries into numbered sitemap files, starting a new one at the caps."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.chunks = []  # (file name, latest lastmod)
+        self.f = None
+
+    def _open(self):
+        name = f"sitemap-{len(self.chunks) + 1}.xml"
+        self.f = open(os.path.join(self.out_dir, name), "w", encoding="utf-8")
+        self.f.write(URLSET_OPEN)
+        self.chunks.append([name, None])
+        self.count, self.size = 0, len(URLSET_OPEN) + len(URLSET_CLOSE)
+
+    def _close(self):
+        if self.f:
+            self.f.write(URLSET_CLOSE)
+            self.f.close()
+            self.f = None
+
+    def add(self, loc, lastmod):
+        entry = f"  <url><loc>{escape(loc)}</loc>"
+        if lastmod:
+            entry += f"<lastmod>{lastmod}</lastmod>"
+        entry += "</url>\n"
+        n = len(entry.encode())
+        if self.f is None or self.count >= MAX_URLS or self.size + n > MAX_BYTES:
+            self._close()
+            self._open()
+        self.f.write(entry)
+        self.count += 1
+        self.size += n
+        chunk = self.chunks[-1]
+        if lastmod and (chunk[1] is None or lastmod > chunk[1]):
+            chunk[1] = lastmod
+
+    def finish(self):
+        self._close()
+        return self.chunks
+
+
+def write_sitemaps(dist_dir=DIST_DIR):
+    out_dir = os.path.join(dist_dir, SITEMAPS_DIR)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    writer = ChunkWriter(out_dir)
+    urls = 0
+    for loc, lastmod in iter_pages(dist_dir):
+        writer.add(loc, lastmod)
+        urls += 1
+    chunks = writer.finish()
+
+    with open(os.path.join(dist_dir, "sitemap.xml"), "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for name, lastmod in chunks:
+            f.write(f"  <sitemap><loc>{BASE_URL}/{SITEMAPS_DIR}/{name}</loc>")
+            f.write(f"<lastmod>{lastmod}</lastmod></sitemap>\n" if lastmod else "</sitemap>\n")
+        f.write("</sitemapindex>\n")
+    with open(os.path.join(dist_dir, "robots.txt"), "w") as f:
+        f.write(f"User-agent: *\nAllow: /\n\nSitemap: {BASE_URL}/sitemap.xml\n")
+    print(f"✓ Sitemap generated at {os.path.join(dist_dir, 'sitemap.xml')} "
+          f"({urls} URLs in {len(chunks)} file(s))")
+
+
+def main():
+    if not os.path.isdir(DIST_DIR):
+        print(f"✗ {DIST_DIR}/ not found; run scripts/aggregate.py first", file=sys.stderr)
+        sys.exit(1)
+    write_sitemaps()
+
+
+if __name__ == "__main__":
+    main()
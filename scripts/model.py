@@ -0,0 +1,126 @@
+"""
+Typed records shared by the pipeline and the generators.
+
+Service records used to be plain dicts with `.get()` defaults repeated in
+every script. They are now slotted dataclasses built in one place:
+Service.from_manifest (aggregate.py) and load_services (generators), which
+reads the metadata store or falls back to _build/services.json.
+
+Slots drop the per-instance __dict__, and the strings repeated across
+thousands of records (domain, team, Diataxis types) are interned, so large
+registries keep one copy of each. Pages are loaded as Page records only
+when a generator asks for them, one service at a time.
+"""
+import json
+import os
+import sys
+from contextlib import closing
+from dataclasses import asdict, dataclass
+
+import routing
+import servicedb
+
+SERVICES_JSON = os.path.join("_build", "services.json")
+
+
+def _intern(value):
+    return sys.intern(value) if value else ""
+
+
+@dataclass(slots=True)
+class Repo:
+    url: str
+    branch: str = "main"
+    commit_sha: str | None = None
+    committed_at: str | None = None
+
+    @classmethod
+    def from_entry(cls, entry, commit_sha=None, committed_at=None):
+        """A repo from its docs-registry.yaml entry and the commit checked out."""
+        return cls(url=entry["url"], branch=entry.get("branch", "main"),
+                   commit_sha=commit_sha, committed_at=committed_at)
+
+
+@dataclass(slots=True)
+class Service:
+    id: str
+    name: str
+    domain: str = "other"
+    team: str = ""
+    pages: int = 0
+    diataxis: tuple[str, ...] = ()
+    path: str = ""
+
+    def __post_init__(self):
+        self.domain = _intern(self.domain) or "other"
+        self.team = _intern(self.team)
+        self.diataxis = tuple(_intern(t) for t in self.diataxis)
+        self.name = self.name or self.id
+        # Records written before routed paths were recorded use domain routing.
+        self.path = self.path or routing.DEFAULT.path(self)
+
+    @classmethod
+    def from_manifest(cls, manifest, docs_path):
+        """A service from its docspine.yaml; `path` is filled in by routing.Router."""
+        service_id = manifest.get("service", docs_path)
+        return cls(
+            id=service_id,
+            name=manifest.get("nav_title", service_id),
+            domain=manifest.get("domain", "other"),
+            team=manifest.get("team", ""),
+            pages=manifest.get("pages", 0),
+            diataxis=tuple(manifest.get("diataxis", [])),
+        )
+
+    @classmethod
+    def from_record(cls, record):
+        """A service from a services.json record or a store row."""
+        def field(key, default):
+            return record[key] if key in record.keys() and record[key] is not None else default
+
+        diataxis = field("diataxis", [])
+        if isinstance(diataxis, str):
+            diataxis = json.loads(diataxis)
+        return cls(
+            id=record["id"],
+            name=field("name", ""),
+            domain=field("domain", ""),
+            team=field("team", ""),
+            pages=field("pages", 0),
+            diataxis=tuple(diataxis),
+            path=field("path", ""),
+        )
+
+    def to_record(self):
+        """The services.json / landing page form."""
+        record = asdict(self)
+        record["diataxis"] = list(self.diataxis)
+        return record
+
+
+@dataclass(slots=True)
+class Page:
+    url: str
+    title: str
+    content_hash: str = ""
+
+
+def load_services(services_json=SERVICES_JSON):
+    """All services in registry order, from the metadata store or services.json."""
+    if servicedb.exists():
+        with closing(servicedb.connect()) as conn:
+            return [Service.from_record(row) for row in servicedb.service_rows(conn)]
+    if not os.path.exists(services_json):
+        print(f"✗ {services_json} not found; run scripts/aggregate.py first", file=sys.stderr)
+        sys.exit(1)
+    with open(services_json) as f:
+        return [Service.from_record(r) for r in json.load(f)]
+
+
+def load_pages(service, service_dir, conn=None):
+    """Pages of one service, from the store or by scanning its built output."""
+    if conn is not None:
+        rows = servicedb.service_pages(conn, service.id)
+    else:
+        rows = [(url, title) for url, title, _ in servicedb.scan_pages(service_dir)]
+    return [Page(url, title) for url, title in rows]
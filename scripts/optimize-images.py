@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Optimizes PNG and JPEG images in dist/ and adds responsive variants.
+
+Runs right after the service copies, before dedup-assets.py, so savings can be
+attributed to the service that shipped each image:
+
+  - PNGs are recompressed losslessly (oxipng when installed, else Pillow's
+    optimizer, carrying over ICC profile, gamma and text chunks) and replaced
+    only if the result is smaller and, with Pillow, pixel- and
+    metadata-identical. JPEGs keep their original bytes: re-encoding them is
+    never lossless.
+  - Images wider than a variant width get resized siblings
+    (<name>.<width>w.<ext>) when those come out smaller than the optimized
+    original, and every <img> pointing at them gains srcset, sizes, width and
+    height, so browsers fetch a size that fits the layout and reserve its
+    space up front.
+
+Work is spread over a process pool and cached in _build/image-cache/ by
+content hash, so an image is only processed once across runs. Needs Pillow;
+without it the stage is skipped.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+from model import load_services
+
+try:
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+except ImportError:
+    Image = None
+try:
+    import oxipng
+except ImportError:
+    oxipng = None
+
+DIST_DIR = "dist"
+CACHE_DIR = os.path.join("_build", "image-cache")
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
+VARIANT_WIDTHS = (480, 960, 1440)
+SIZES = "(max-width: 960px) 100vw, 960px"
+# Layout details Pillow does not keep but that never change how a PNG looks.
+PNG_LAYOUT_INFO = {"interlace"}
+# Bump when optimizer or variant settings change to invalidate the cache.
+CACHE_VERSION = b"3"
+
+_IMG = re.compile(rb"<img\b[^>]*>", re.I)
+_SRC = re.compile(rb'\ssrc="([^"]+)"', re.I)
+
+_images = {}  # set in pool workers for rewrite_page
+
+
+def variant_path(path, width):
+    base, ext = os.path.splitext(path)
+    return f"{base}.{width}w{ext}"
+
+
+def png_info(im):
+    """A PngInfo carrying the text, gAMA, sRGB and cHRM chunks of im."""
+    info = PngInfo()
+    for key, value in im.text.items():
+        info.add_text(key, value)
+    if "gamma" in im.info:
+        info.add(b"gAMA", struct.pack(">I", round(im.info["gamma"] * 100000)))
+    if "srgb" in im.info:
+        info.add(b"sRGB", bytes([im.info["srgb"]]))
+    if "chromaticity" in im.info:
+        info.add(b"cHRM", struct.pack(">8I", *(round(v * 100000) for v in im.info["chromaticity"])))
+    return info
+
+
+def optimize_png(data):
+    """Recompress a PNG losslessly; returns data itself when Pillow's result
+    would change a pixel or drop metadata it cannot carry over."""
+    if oxipng:
+        return oxipng.optimize_from_memory(data, level=4, strip=oxipng.StripChunks.safe())
+    with Image.open(io.BytesIO(data)) as im:
+        if getattr(im, "n_frames", 1) > 1:
+            return data  # APNG: Pillow would need every frame re-encoded
+        out = io.BytesIO()
+        extra = {k: im.info[k] for k in ("icc_profile", "dpi", "exif") if k in im.info}
+        im.save(out, "PNG", optimize=True, pnginfo=png_info(im), **extra)
+        with Image.open(io.BytesIO(out.getvalue())) as new:
+            kept = (set(im.info) - PNG_LAYOUT_INFO <= set(new.info) and new.text == im.text
+                    and new.mode == im.mode and new.tobytes() == im.tobytes())
+    return out.getvalue() if kept else data
+
+
+def render_variant(data, fmt, width):
+    with Image.open(io.BytesIO(data)) as im:
+        colors = None
+        if im.mode in ("P", "1"):
+            # Resampling needs real colour values; palette indices would only
+            # allow nearest-neighbour. The result is quantized back to the
+            # source's palette size, or it would outweigh the original.
+            colors = 2 if im.mode == "1" else len(im.getpalette() or ()) // 3 or 256
+            im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+        height = round(im.height * width / im.width)
+        resized = im.resize((width, height), Image.LANCZOS)
+        if colors:
+            method = Image.Quantize.FASTOCTREE if resized.mode == "RGBA" else Image.Quantize.MEDIANCUT
+            resized = resized.quantize(colors, method)
+        out = io.BytesIO()
+        if fmt == "PNG":
+            resized.save(out, "PNG", optimize=True)
+        else:
+            resized.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def process_image(path, cache_dir):
+    """Optimize one image and write its variants.
+    Returns (path, status, bytes_before, bytes_after, variant bytes, width,
+    height, variant widths).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha256(CACHE_VERSION + data).hexdigest()
+    entry = os.path.join(cache_dir, key[:2], key)
+
+    status = "hit"
+    if not os.path.isdir(entry):
+        status = "miss"
+        tmp = f"{entry}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            with Image.open(io.BytesIO(data)) as im:
+                fmt, width, height = im.format, im.width, im.height
+        except Exception:
+            fmt, width, height = None, 0, 0  # unreadable: leave it alone
+        widths, size = [], len(data)
+        if fmt == "PNG":
+            optimized = optimize_png(data)
+            if len(optimized) < size:
+                size = len(optimized)
+                with open(os.path.join(tmp, "full"), "wb") as f:
+                    f.write(optimized)
+        if fmt in ("PNG", "JPEG"):
+            for w in VARIANT_WIDTHS:
+                if w >= width:
+                    continue
+                variant = render_variant(data, fmt, w)
+                if len(variant) < size:  # a larger variant would only cost bytes
+                    with open(os.path.join(tmp, str(w)), "wb") as f:
+                        f.write(variant)
+                    widths.append(w)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"width": width, "height": height, "variants": widths}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)  # another worker cached the same content first
+
+    with open(os.path.join(entry, "meta.json")) as f:
+        meta = json.load(f)
+    full = os.path.join(entry, "full")
+    if os.path.exists(full):
+        install(full, path)
+    added = 0
+    for w in meta["variants"]:
+        install(os.path.join(entry, str(w)), variant_path(path, w))
+        added += os.path.getsize(os.path.join(entry, str(w)))
+    return (path, status, len(data), os.path.getsize(path), added,
+            meta["width"], meta["height"], meta["variants"])
+
+
+def install(src, dst):
+    """Copy via a temp file and rename, never writing through a hardlink."""
+    tmp = f"{dst}.tmp{os.getpid()}"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _init_rewrite(images):
+    global _images
+    _images = images
+
+
+def rewrite_page(path):
+    """Add srcset/sizes/width/height to <img> tags whose image has variants."""
+    with open(path, "rb") as f:
+        data = f.read()
+    page_dir = os.path.dirname(path)
+
+    def add_srcset(m):
+        tag = m.group(0)
+        src = _SRC.search(tag)
+        if not src or b"srcset=" in tag.lower():
+            return tag
+        ref = src.group(1).decode("utf-8", "replace")
+        if "://" in ref or ref.startswith(("/", "data:")):
+            return tag
+        target = os.path.normpath(os.path.join(page_dir, ref.split("#")[0].split("?")[0]))
+        info = _images.get(target)
+        if not info or not info[2]:
+            return tag
+        width, height, widths = info
+        srcset = ", ".join([f"{variant_path(ref, w)} {w}w" for w in widths] + [f"{ref} {width}w"])
+        attrs = f' srcset="{srcset}" sizes="{SIZES}"'
+        if b" width=" not in tag and b" height=" not in tag:
+            attrs += f' width="{width}" height="{height}"'
+        end = -2 if tag.endswith(b"/>") else -1
+        return tag[:end].rstrip() + attrs.encode() + tag[end:]
+
+    out = _IMG.sub(add_srcset, data)
+    if out != data:
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(out)
+        os.replace(tmp, path)
+        return 1
+    return 0
+
+
+def collect(site_dir, exts):
+    for root, _, files in os.walk(site_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in exts and not re.search(r"\.\d+w\.\w+$", name):
+                yield os.path.join(root, name)
+
+
+def optimize_site(site_dir, service_paths=(), cache_dir=CACHE_DIR, workers=None):
+    """Optimize every image under site_dir and print a per-service report.
+    service_paths are the routed service paths used to attribute savings.
+    Returns total bytes saved.
+    """
+    if Image is None:
+        print("→ Skipping image optimization (Pillow not installed)")
+        return 0
+    os.makedirs(cache_dir, exist_ok=True)
+    for i in range(256):
+        os.makedirs(os.path.join(cache_dir, f"{i:02x}"), exist_ok=True)
+
+    prefixes = sorted(service_paths, key=len, reverse=True)
+    paths = sorted(collect(site_dir, IMAGE_EXTS))
+    saved, added = defaultdict(int), defaultdict(int)
+    images, hits, variants = {}, 0, 0
+    with ProcessPoolExecutor(workers) as pool:
+        for path, status, before, after, extra, w, h, widths in pool.map(
+                process_image, paths, [cache_dir] * len(paths), chunksize=8):
+            hits += status == "hit"
+            variants += len(widths)
+            images[os.path.normpath(path)] = (w, h, widths)
+            rel = os.path.relpath(path, site_dir).replace(os.sep, "/")
+            owner = next((p for p in prefixes if rel.startswith(p + "/")), "(site root)")
+            saved[owner] += before - after
+            added[owner] += extra
+
+    pages = sorted(collect(site_dir, {".html"}))
+    with ProcessPoolExecutor(workers, initializer=_init_rewrite, initargs=(images,)) as pool:
+        rewritten = sum(pool.map(rewrite_page, pages, chunksize=32))
+
+    total = sum(saved.values())
+    telemetry.CACHE_HITS.inc(hits, cache="images")
+    telemetry.CACHE_MISSES.inc(len(paths) - hits, cache="images")
+    print(f"✓ Optimized {len(paths)} images in {site_dir}/ ({hits} cached, {len(paths) - hits} new): "
+          f"{total} bytes saved, {variants} responsive variants ({sum(added.values())} bytes added), "
+          f"{rewritten} pages with srcset" + ("" if oxipng else " (oxipng not installed, using Pillow)"))
+    for owner in sorted(saved, key=lambda o: added[o] - saved[o]):
+        if saved[owner] or added[owner]:
+            print(f"  {owner}: {saved[owner]} bytes saved, {added[owner]} bytes of variants added "
+                  f"({saved[owner] - added[owner]:+d} net)")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize images in dist/ and add responsive variants.")
+    parser.add_argument("--site", default=DIST_DIR)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    optimize_site(args.site, [s.path for s in load_services()], args.cache, args.workers)
+
+
+if __name__ == "__main__":
+    main()
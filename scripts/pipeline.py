@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Docspine pipeline orchestrator.
+
+Runs the whole site build in one interpreter as a DAG of stages instead of
+separate aggregate / landing / llms.txt / Pagefind / compress launches:
+
+  clone(repo) → build(service) → copy(service) ─┬→ llms, sitemap, feeds, redirects ─┐
+       └──────→ landing (once every repo is     │                                    ├→ index → sw → links
+                cloned and its manifests read)  └→ images → dedup ───────────────────┘   → compress
+                                                                                         → store → publish
+
+Stages are scheduled with asyncio over worker pools: clones and subprocess
+builds run on thread pools (in-process mkdocs builds go to aggregate.py's
+pre-warmed forkserver workers, --remote-worker builds to build-worker.py
+hosts), and each service's build starts as soon as its
+repo is cloned, its copy as soon as it is built. Service records are handed to
+the landing page and llms.txt generators in memory; _build/services.json is
+still written for tools that read it. Services that moved since the last build
+(routing.py) get redirect stubs at their old paths.
+
+Every run works in its own workspace (workspace.py): repos are cloned under
+_build/runs/<id>/ and the site is assembled in a staging tree that is swapped
+into dist/ atomically once every stage has passed, so concurrent runs and
+readers of dist/ never see a partial site.
+
+Services whose docs and declared shared inputs (shared_paths: a common theme,
+snippets) are unchanged since their last build reuse the cached output
+instead of building (depgraph.py).
+
+With --watch (usually with --local-root pointing at local checkouts) the
+pipeline stays up after the first build: edits under a service's source tree
+rebuild just that service, edits to a shared input rebuild exactly the
+services that declare it (in parallel); only the changed files are re-synced
+into dist/, the landing page and llms.txt are regenerated when a manifest
+changed, and _build/preview-reload is bumped so a running preview server
+reloads the browser.
+
+Each finished build is saved to the content-addressed site store
+(site-store.py) so any recent site can be restored without rebuilding.
+Structured events go to _build/logs/run-<id>.jsonl and Prometheus metrics to
+_build/metrics.prom (telemetry.py).
+"""
+import argparse
+import asyncio
+import functools
+import importlib.util
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import aggregate
+import depgraph
+import facets
+import routing
+import servicedb
+import telemetry
+import workspace
+from model import Repo
+from watcher import TreeWatcher
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ("images", "dedup", "index", "sw", "links", "compress", "store")
+RELOAD_FILE = os.path.join(aggregate.BUILD_DIR, "preview-reload")
+
+
+def load_script(filename):
+    """Import one of the hyphen-named sibling scripts as a module."""
+    name = filename[:-3].replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    # Registered so process-pool workers can unpickle the module's functions.
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+landing = load_script("generate-landing-page.py")
+llms = load_script("generate-llms-txt.py")
+sitemap = load_script("generate-sitemap.py")
+feeds = load_script("generate-feeds.py")
+dedup = load_script("dedup-assets.py")
+links = load_script("check-links.py")
+compress = load_script("compress-assets.py")
+images = load_script("optimize-images.py")
+store = load_script("site-store.py")
+
+
+class Pipeline:
+    def __init__(self, args):
+        self.args = args
+        self.registry = aggregate.load_registry()
+        self.router = routing.Router.from_registry(self.registry)
+        self.repos = self.registry.get("repos", [])
+        self.builder = aggregate.Builder(in_process=args.in_process, workers=args.jobs,
+                                         remote=args.remote_worker)
+        self.clone_pool = ThreadPoolExecutor(args.jobs, thread_name_prefix="clone")
+        self.build_pool = ThreadPoolExecutor(args.jobs, thread_name_prefix="build")
+        self.timings = defaultdict(float)
+        self.jobs = []
+        self.docs_paths = {}
+        self.repo_ids = {}
+        self.positions = {}
+        self.repo_entries = {}
+        self.clone_dests = {}
+        self.graph = depgraph.DepGraph()
+        self.ws = workspace.Workspace(aggregate.BUILD_DIR, aggregate.DIST_DIR)
+        self.db = servicedb.connect()
+        self.run_id = servicedb.start_run(self.db)
+        self.previous_routes = servicedb.route_table(self.db)
+
+    async def stage(self, name, pool, fn, *args):
+        """Run a blocking stage function on a pool and record its duration."""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, functools.partial(fn, *args))
+        finally:
+            self.timings[name] += time.monotonic() - start
+
+    async def clone(self, repo_entry, offset):
+        clone_dest, manifests = await self.stage(
+            "clone", self.clone_pool, aggregate.prepare_repo,
+            repo_entry, self.ws.clones, self.args.local_root)
+        head = await self.stage("clone", self.clone_pool, aggregate.repo_head, clone_dest)
+        repo_id = servicedb.upsert_repo(self.db, Repo.from_entry(repo_entry, *head))
+        jobs = list(aggregate.service_jobs(repo_entry, clone_dest, manifests, self.router))
+        self.builder.add_services([job[0] for job in jobs])
+        for i, ((service_root, output_dir, _), svc_entry) in enumerate(zip(jobs, repo_entry.get("services", []))):
+            self.docs_paths[service_root] = os.path.relpath(service_root, clone_dest)
+            self.repo_ids[service_root] = repo_id
+            self.positions[service_root] = offset + i
+            self.repo_entries[service_root] = repo_entry
+            self.clone_dests[service_root] = clone_dest
+            self.graph.add(service_root, output_dir, clone_dest,
+                           aggregate.shared_paths(repo_entry, manifests[svc_entry["docs_path"].strip("/")]))
+        return jobs
+
+    def store(self, service_root, record, pages):
+        """Upsert a built service and its pages into the metadata store."""
+        servicedb.upsert_service(self.db, record, self.repo_ids[service_root],
+                                 self.docs_paths[service_root], self.positions[service_root])
+        return servicedb.sync_pages(self.db, record.id, pages)
+
+    async def service(self, job):
+        service_root, output_dir, record = job
+        print(f"\n  → Building {record.domain}/{record.id}")
+        site_dir, duration, outcome, fingerprint = await self.stage(
+            "build", self.build_pool, aggregate.cached_build, self.builder, self.graph,
+            record, service_root, output_dir, not self.args.no_build_cache)
+        servicedb.record_build(self.db, self.run_id, record.id, duration, outcome)
+        aggregate.report_build(record, duration, outcome)
+        if outcome == "failed":
+            sys.exit(1)
+        dest = aggregate.service_dest(self.ws.dist, record)
+        if outcome == "ok":
+            await self.stage("copy", None, facets.annotate_site, site_dir, record)
+            await self.stage("copy", None, depgraph.save_output, record.id, *fingerprint, site_dir)
+        files, nbytes, pages = await self.stage("copy", None, aggregate.copy_output, site_dir, dest)
+        aggregate.report_copy(record, files, nbytes)
+        self.store(service_root, record, pages)
+
+    async def index(self):
+        print("\n→ Indexing with Pagefind")
+        start = time.monotonic()
+        proc = await asyncio.create_subprocess_shell(f"npx pagefind --site {self.ws.dist}")
+        if await proc.wait() != 0:
+            print(f"  ✗ Pagefind failed (exit {proc.returncode})", file=sys.stderr)
+            telemetry.FAILURES.inc(stage="index")
+            sys.exit(proc.returncode)
+        self.timings["index"] += time.monotonic() - start
+
+    async def run(self):
+        skip = set(self.args.skip)
+        if self.args.watch:
+            # Later incremental syncs would undo these piecemeal, and a service
+            # worker would serve edited pages stale.
+            skip |= {"images", "dedup", "sw", "compress", "store"}
+
+        # Each service's build/copy chain starts the moment its repo is cloned.
+        offsets = [sum(len(r.get("services", [])) for r in self.repos[:i]) for i in range(len(self.repos))]
+        clones = [asyncio.create_task(self.clone(r, o)) for r, o in zip(self.repos, offsets)]
+        services = []
+        for done in asyncio.as_completed(clones):
+            services += [asyncio.create_task(self.service(job)) for job in await done]
+
+        # Every manifest is read once all clones finish, so the landing page
+        # can render alongside the builds from in-memory records.
+        self.jobs = [job for task in clones for job in task.result()]
+        records = [record for _, _, record in self.jobs]
+        aggregate.write_services_json(records)
+        generators = [asyncio.create_task(self.stage("landing", None, landing.write_landing, records, self.ws.dist))]
+
+        # llms.txt lists each service's published pages, so it waits for the
+        # copies; these generators read the metadata store and run alongside
+        # images and dedup.
+        await asyncio.gather(*services)
+        servicedb.prune_services(self.db, [r.id for r in records])
+        redirects = self.redirects(records)
+        generators.append(asyncio.create_task(
+            self.stage("redirects", None, routing.write_redirects, self.ws.dist, redirects)))
+        generators.append(asyncio.create_task(self.stage("llms", None, llms.write_llms, records, self.ws.dist)))
+        generators.append(asyncio.create_task(self.stage("sitemap", None, sitemap.write_sitemaps, self.ws.dist)))
+        generators.append(asyncio.create_task(self.stage("feeds", None, feeds.write_feeds, self.ws.dist, self.run_id)))
+        if "images" not in skip:
+            await self.stage("images", None, images.optimize_site, self.ws.dist, [r.path for r in records])
+        if "dedup" not in skip:
+            await self.stage("dedup", None, dedup.dedup_site, self.ws.dist, True)
+        await asyncio.gather(*generators)
+        if "index" not in skip:
+            await self.index()
+        if "sw" not in skip:
+            await self.stage("sw", None, landing.write_service_worker, self.ws.dist)
+        if "links" not in skip:
+            broken = await self.stage("links", None, links.check_site, self.ws.dist)
+            if broken:
+                telemetry.FAILURES.inc(stage="links")
+                telemetry.log("links", broken=broken)
+            if broken and not self.args.links_warn_only:
+                sys.exit(1)
+        if "compress" not in skip:
+            await self.stage("compress", None, compress.compress_site, self.ws.dist)
+        if "store" not in skip:
+            await self.stage("store", None, self.save_site, [r.path for r in records])
+        await self.stage("publish", None, self.ws.publish)
+
+        telemetry.SERVICES.set(len(records))
+        print(f"\n✓ Pipeline finished: {len(records)} service(s) in {aggregate.DIST_DIR}/")
+        print("  " + " / ".join(f"{name} {secs:.1f}s" for name, secs in self.timings.items()))
+
+    def redirects(self, records):
+        """Record services moved since the last build; return every redirect to write."""
+        current = {r.id: r.path for r in records}
+        previous = self.router.previous_paths(self.previous_routes, records)
+        servicedb.record_moves(self.db, routing.moved(previous, current), self.run_id)
+        self.previous_routes = current
+        return servicedb.redirect_rows(self.db, self.run_id)
+
+    def write_metrics(self, status):
+        for name, secs in self.timings.items():
+            telemetry.STAGE_SECONDS.set(round(secs, 3), stage=name)
+        telemetry.LAST_RUN.set(int(time.time()), status=status)
+        telemetry.write_metrics()
+
+    def save_site(self, prefixes):
+        with workspace.lock("store"):
+            store.save_site(self.ws.dist, prefixes=sorted(prefixes, key=len, reverse=True),
+                            label=f"run {self.run_id}")
+            store.gc(keep=self.args.keep_sites)
+
+    def rebuild(self, indices, changed):
+        """Rebuild services after a source change, in parallel, and sync them into the live dist/."""
+        self.graph.forget(changed)
+        previous, futures = {}, {}
+        for i in sorted(indices):
+            service_root, output_dir, record = self.jobs[i]
+            previous[i] = record
+            if os.path.abspath(os.path.join(service_root, "docspine.yaml")) in changed:
+                manifest = aggregate.load_manifest(service_root)
+                record, output_dir = aggregate.service_record(
+                    manifest, self.docs_paths[service_root], self.router)
+                self.graph.add(service_root, output_dir, self.clone_dests[service_root],
+                               aggregate.shared_paths(self.repo_entries[service_root], manifest))
+            self.jobs[i] = (service_root, output_dir, record)
+            print(f"\n  → Rebuilding {record.domain}/{record.id}")
+            futures[i] = self.build_pool.submit(aggregate.cached_build, self.builder, self.graph, record,
+                                                service_root, output_dir, not self.args.no_build_cache)
+
+        start = time.monotonic()
+        results = {i: future.result() for i, future in futures.items()}
+        records_changed = moved = synced = False
+        # The live site is patched in place; hold off a concurrent publish.
+        with workspace.lock("dist"):
+            for i, (site_dir, duration, outcome, fingerprint) in results.items():
+                service_root, output_dir, record = self.jobs[i]
+                servicedb.record_build(self.db, self.run_id, record.id, duration, outcome)
+                aggregate.report_build(record, duration, outcome)
+                if outcome == "failed":
+                    print(f"  ✗ {record.id} failed to build; waiting for the next change", file=sys.stderr)
+                    self.jobs[i] = (service_root, output_dir, previous[i])
+                    continue
+                old_dest = aggregate.service_dest(aggregate.DIST_DIR, previous[i])
+                dest = aggregate.service_dest(aggregate.DIST_DIR, record)
+                if dest != old_dest and os.path.exists(old_dest):
+                    shutil.rmtree(old_dest)
+                if outcome == "ok":
+                    facets.annotate_site(site_dir, record)
+                    depgraph.save_output(record.id, *fingerprint, site_dir)
+                copied, removed, pages = aggregate.sync_tree(site_dir, dest)
+                print(f"  ✓ → {dest}/ ({len(copied)} updated, {len(removed)} removed, "
+                      f"{time.monotonic() - start:.1f}s)")
+                aggregate.report_copy(record, len(copied),
+                                      sum(os.path.getsize(os.path.join(dest, rel)) for rel in copied))
+                self.store(service_root, record, pages)
+                records_changed |= record != previous[i]
+                moved |= dest != old_dest
+                synced |= bool(copied or removed)
+
+            servicedb.prune_services(self.db, [r.id for _, _, r in self.jobs])
+            records = [r for _, _, r in self.jobs]
+            if moved:
+                routing.write_redirects(aggregate.DIST_DIR, self.redirects(records))
+            if records_changed:
+                aggregate.write_services_json(records)
+                landing.write_landing(records, aggregate.DIST_DIR)
+            if records_changed or synced:
+                llms.write_llms(records, aggregate.DIST_DIR)
+                sitemap.write_sitemaps(aggregate.DIST_DIR)
+                feeds.write_feeds(aggregate.DIST_DIR, self.run_id)
+        return records_changed or synced
+
+    def watch(self):
+        build_dir = os.path.abspath(aggregate.BUILD_DIR) + os.sep
+        roots = [job[0] for job in self.jobs if not os.path.abspath(job[0]).startswith(build_dir)]
+        if not roots:
+            print("✗ Nothing to watch: no service uses a local checkout (see --local-root)", file=sys.stderr)
+            sys.exit(1)
+        # Shared inputs (depgraph.py) are watched too; a file is watched through its directory.
+        shared = [p if os.path.isdir(p) else os.path.dirname(p)
+                  for p in self.graph.shared() if not p.startswith(build_dir)]
+        outputs = [os.path.join(root, out) for root, out, _ in self.jobs]
+        watcher = TreeWatcher(sorted(set(roots + shared)), ignore=outputs)
+        print(f"\n👀 Watching {len(roots)} service(s) and {len(shared)} shared input(s) "
+              f"via {watcher.mode}; Ctrl-C to stop")
+        generation = 0
+        try:
+            while True:
+                changed = watcher.wait()
+                affected = self.graph.affected(changed)
+                indices = [i for i, job in enumerate(self.jobs) if os.path.abspath(job[0]) in affected]
+                updated = self.rebuild(indices, changed) if indices else False
+                self.write_metrics("ok")
+                if updated:
+                    generation += 1
+                    with open(RELOAD_FILE, "w") as f:
+                        f.write(f"{generation} {time.time()}\n")
+        except KeyboardInterrupt:
+            print("\n✓ Watch stopped")
+        finally:
+            watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the aggregated docs site end to end.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="concurrent clones and builds (default: CPU count)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="build plain-mkdocs services through pre-warmed worker processes")
+    parser.add_argument("--remote-worker", metavar="URL", action="append", default=[],
+                        help="offload builds to a build-worker.py at URL (repeatable; see buildfarm.py)")
+    parser.add_argument("--no-build-cache", action="store_true",
+                        help="rebuild every service even if its docs and shared inputs are unchanged")
+    parser.add_argument("--skip", action="append", default=[], choices=STAGES,
+                        help="skip a post-build stage (repeatable)")
+    parser.add_argument("--links-warn-only", action="store_true",
+                        help="report broken internal links without failing")
+    parser.add_argument("--keep-sites", type=int, default=store.KEEP,
+                        help=f"sites kept in {store.STORE_DIR}/ (default: {store.KEEP})")
+    parser.add_argument("--local-root", metavar="DIR",
+                        help="use existing checkouts at DIR/<repo-slug> instead of cloning")
+    parser.add_argument("--watch", action="store_true",
+                        help="after the first build, rebuild services incrementally as local sources change")
+    parser.add_argument("--log-format", choices=("text", "json"), default="text",
+                        help="json: also echo structured events to stderr "
+                             f"(they are always written to {telemetry.LOG_DIR}/)")
+    pipeline = Pipeline(parser.parse_args())
+    telemetry.configure(pipeline.run_id, echo=pipeline.args.log_format == "json")
+    status = "failed"
+    try:
+        asyncio.run(pipeline.run())
+        status = "ok"
+        if pipeline.args.watch:
+            pipeline.watch()
+    finally:
+        servicedb.finish_run(pipeline.db, pipeline.run_id, status)
+        pipeline.db.close()
+        pipeline.builder.close()
+        pipeline.ws.close()
+        if status != "ok":
+            telemetry.FAILURES.inc(stage="pipeline")
+        telemetry.log("run", status=status, timings={k: round(v, 3) for k, v in pipeline.timings.items()})
+        pipeline.write_metrics(status)
+        telemetry.close()
+
+
+if __name__ == "__main__":
+    main()
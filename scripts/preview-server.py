@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Local preview server for the assembled site in dist/.
+
+Serves dist/ the way a production static host would, so landing page and
+Pagefind load behaviour can be measured before deploying:
+
+  - precompressed .br / .gz siblings (compress-assets.py) are served with
+    Content-Encoding when the client accepts them
+  - strong ETags and Last-Modified, answering If-None-Match /
+    If-Modified-Since with 304
+  - single byte-range requests (Range / If-Range, 206 / 416)
+  - file bodies are sent with sendfile(2) where the platform supports it
+
+Every request is logged with status, bytes sent, encoding and latency.
+With --live-reload, HTML pages get a small script that reloads the browser
+whenever pipeline.py --watch bumps _build/preview-reload.
+"""
+import argparse
+import email.utils
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+DIST_DIR = "dist"
+RELOAD_FILE = os.path.join("_build", "preview-reload")
+RELOAD_PATH = "/__reload"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+RELOAD_SNIPPET = (
+    "<script>new EventSource('" + RELOAD_PATH + "')"
+    ".onmessage = () => location.reload();</script>"
+).encode()
+
+mimetypes.add_type("application/javascript", ".mjs")
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/plain; charset=utf-8", ".txt")
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into the set of codings with a non-zero q-value."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = re.search(r"q=([0-9.]+)", params)
+        if coding and (not q or float(q.group(1)) > 0):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    server_version = "DocspinePreview/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # ── request entry points ──
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def log_message(self, fmt, *args):
+        pass  # replaced by the per-request line in _log
+
+    def _log(self, status, sent, encoding=""):
+        ms = (time.perf_counter() - self._start) * 1000
+        print(f"  {self.command} {self.path} → {status} {sent}B"
+              f"{' ' + encoding if encoding else ''} {ms:.1f}ms", flush=True)
+
+    # ── helpers ──
+
+    def _resolve(self):
+        """Map the request path to a file under the site root, or an error status."""
+        path = unquote(urlsplit(self.path).path)
+        base = self.server.base_path
+        if base:
+            if path == base:
+                return "redirect", base + "/"
+            if not path.startswith(base + "/"):
+                return HTTPStatus.NOT_FOUND, None
+            path = path[len(base):]
+        rel = posixpath.normpath(path).lstrip("/")
+        if rel.startswith(".."):
+            return HTTPStatus.FORBIDDEN, None
+        root = os.path.realpath(self.server.site_dir)
+        full = os.path.join(root, rel)
+        if os.path.isdir(full):
+            if not path.endswith("/"):
+                return "redirect", (base or "") + path + "/"
+            full = os.path.join(full, "index.html")
+        if not os.path.isfile(full):
+            return HTTPStatus.NOT_FOUND, None
+        return HTTPStatus.OK, full
+
+    def _send_error(self, status, head):
+        body = f"{status.value} {status.phrase}\n".encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self._log(status.value, 0 if head else len(body))
+
+    def _not_modified(self, etag, mtime):
+        inm = self.headers.get("If-None-Match")
+        if inm is not None:
+            return inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]
+        ims = self.headers.get("If-Modified-Since")
+        if ims:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                pass
+        return False
+
+    def _byte_range(self, size, etag, last_modified):
+        """Return (start, end) for a satisfiable single range, None for a full
+        response, or False if the range cannot be satisfied."""
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range.strip() not in (etag, last_modified):
+            return None
+        m = RANGE_RE.match(header.strip())
+        if not m:
+            return None  # multiple or malformed ranges: send the whole file
+        first, last = m.groups()
+        if first == "":
+            if not last or int(last) == 0:
+                return False
+            return max(size - int(last), 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or end < start:
+            return False
+        return start, end
+
+    def _send_file(self, f, offset, count):
+        try:
+            self.connection.sendfile(f, offset, count)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # ── serving ──
+
+    def _serve(self, head):
+        self._start = time.perf_counter()
+        if self.server.live_reload and urlsplit(self.path).path == RELOAD_PATH:
+            return self._serve_reload_stream()
+
+        status, full = self._resolve()
+        if status == "redirect":
+            self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+            self.send_header("Location", full)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return self._log(301, 0)
+        if status != HTTPStatus.OK:
+            return self._send_error(status, head)
+
+        ctype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        if ctype.startswith("text/") and "charset" not in ctype or ctype == "application/javascript":
+            ctype += "; charset=utf-8"
+
+        if self.server.live_reload and full.endswith(".html"):
+            return self._serve_injected(full, ctype, head)
+
+        # Ranges apply to the identity representation only.
+        encoding, path = "", full
+        if "Range" not in self.headers:
+            accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+            for coding, suffix in ENCODINGS:
+                if coding in accepted and os.path.isfile(full + suffix):
+                    encoding, path = coding, full + suffix
+                    break
+
+        st = os.stat(path)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+        last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        common = [
+            ("ETag", etag),
+            ("Last-Modified", last_modified),
+            ("Cache-Control", "no-cache"),
+            ("Accept-Ranges", "bytes"),
+            ("Vary", "Accept-Encoding"),
+        ]
+
+        if self._not_modified(etag, st.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for k, v in common:
+                self.send_header(k, v)
+            self.end_headers()
+            return self._log(304, 0, encoding)
+
+        rng = self._byte_range(st.st_size, etag, last_modified)
+        if rng is False:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{st.st_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return self._log(416, 0)
+
+        start, end = rng or (0, st.st_size - 1)
+        length = max(end - start + 1, 0)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT if rng else HTTPStatus.OK)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(length))
+        if rng:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for k, v in common:
+            self.send_header(k, v)
+        self.end_headers()
+        if not head and length:
+            with open(path, "rb") as f:
+                self._send_file(f, start, length)
+        self._log(206 if rng else 200, 0 if head else length, encoding)
+
+    def _serve_injected(self, full, ctype, head):
+        with open(full, "rb") as f:
+            body = f.read()
+        idx = body.rfind(b"</body>")
+        body = body[:idx] + RELOAD_SNIPPET + body[idx:] if idx >= 0 else body + RELOAD_SNIPPET
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self._log(200, 0 if head else len(body))
+
+    def _serve_reload_stream(self):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def stamp():
+            try:
+                return os.stat(self.server.reload_file).st_mtime_ns
+            except FileNotFoundError:
+                return 0
+
+        seen = stamp()
+        try:
+            while True:
+                time.sleep(0.5)
+                current = stamp()
+                if current != seen:
+                    seen = current
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve dist/ locally like the production host.")
+    parser.add_argument("--site", default=DIST_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-path", default="",
+                        help="serve under a URL prefix, e.g. /docspine-demo as on GitHub Pages")
+    parser.add_argument("--live-reload", action="store_true",
+                        help=f"reload pages when {RELOAD_FILE} changes (pipeline.py --watch)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.site):
+        print(f"✗ {args.site}/ not found; build the site first", file=sys.stderr)
+        sys.exit(1)
+
+    server = ThreadingHTTPServer((args.host, args.port), PreviewHandler)
+    server.daemon_threads = True
+    server.site_dir = args.site
+    server.base_path = "/" + args.base_path.strip("/") if args.base_path.strip("/") else ""
+    server.live_reload = args.live_reload
+    server.reload_file = RELOAD_FILE
+    print(f"✓ Serving {args.site}/ at http://{args.host}:{args.port}{server.base_path}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n✓ Preview server stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
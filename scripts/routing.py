@@ -0,0 +1,164 @@
+"""
+URL routing for aggregated services.
+
+Where each service lands below the site root is set under `routing` in
+docs-registry.yaml, either as one of the presets or as a template:
+
+  routing:
+    group_by: domain                    # flat | domain | team
+    template: "{domain}/{team}/{id}"    # overrides group_by when set
+
+Templates may use {id}, {domain}, {team} (the domain when a service has no
+team) and {docs_path}. Characters that are not URL-safe in a rendered segment
+are replaced with "-" (case is kept, so ids publish as they always have), so
+the result is always a clean relative path. aggregate.py routes every record through here;
+the landing page, llms.txt, sitemaps and feeds read the routed `path` off the
+record and never rebuild URLs themselves.
+
+When a service's path changes between builds (it moved domain or team, or
+the template changed), the old path is kept in the metadata store and
+redirect stubs are written there for the service's pages, so existing links
+and bookmarks keep working. Stubs redirect with a relative link and name the
+page's absolute URL as canonical. Only services whose path differs from the
+previous build's routing table get new redirects. On the first build with a
+metadata store there is no routing table yet, so the previous paths are taken
+to be the pre-routing layout (the group_by preset applied to the raw ids),
+and services whose path differs from it get redirects too.
+"""
+import html
+import json
+import os
+import posixpath
+import re
+import string
+import sys
+
+BASE_URL = "https://nondualworks.github.io/docspine-demo"
+PRESETS = {
+    "flat": "{id}",
+    "domain": "{domain}/{id}",
+    "team": "{team}/{id}",
+}
+FIELDS = {"id", "domain", "team", "docs_path"}
+# Top-level directories the pipeline writes into dist/ itself.
+RESERVED = {"_shared", "pagefind", "llms", "sitemaps", "changes", "fonts"}
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._~-]+")
+
+
+def slug(segment):
+    """segment with every run of URL-unsafe characters replaced by "-"."""
+    return _UNSAFE.sub("-", segment.strip()).strip("-.")
+
+
+class Router:
+    def __init__(self, template=PRESETS["domain"], group_by="domain"):
+        fields = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+        unknown = fields - FIELDS
+        if unknown or not fields & {"id", "docs_path"}:
+            raise ValueError(f"routing template {template!r} must use {{id}} or {{docs_path}}, and only "
+                             f"{', '.join('{' + f + '}' for f in sorted(FIELDS))}")
+        self.template = template
+        self.group_by = group_by if group_by in PRESETS else "domain"
+        self.claimed = {}  # path → service id
+        self.paths = {}  # service id → path
+
+    @classmethod
+    def from_registry(cls, registry):
+        routing = registry.get("routing") or {}
+        group_by = routing.get("group_by", "domain")
+        template = routing.get("template") or PRESETS.get(group_by)
+        if template is None:
+            print(f"✗ Unknown routing.group_by {group_by!r} (expected one of: {', '.join(PRESETS)})",
+                  file=sys.stderr)
+            sys.exit(1)
+        try:
+            return cls(template, group_by)
+        except ValueError as e:
+            print(f"✗ {e}", file=sys.stderr)
+            sys.exit(1)
+
+    def path(self, service, docs_path=""):
+        """URL path of a service below the site root."""
+        rendered = self.template.format(id=service.id, domain=service.domain,
+                                        team=service.team or service.domain,
+                                        docs_path=docs_path or service.id)
+        return "/".join(s for s in map(slug, rendered.split("/")) if s)
+
+    def legacy_path(self, service):
+        """Where the pre-routing aggregate.py put a service: the group_by
+        preset with the raw, unslugged ids."""
+        return PRESETS[self.group_by].format(id=service.id, domain=service.domain,
+                                             team=service.team or service.domain)
+
+    def previous_paths(self, table, services):
+        """The previous build's {service id: path}; the legacy layout of
+        services when the store has no routing table yet."""
+        return table or {s.id: self.legacy_path(s) for s in services}
+
+    def route(self, service, docs_path=""):
+        """Set service.path, refusing a path another service already has."""
+        path = self.path(service, docs_path)
+        owner = self.claimed.get(path, service.id)
+        if owner != service.id or path.split("/", 1)[0] in RESERVED:
+            print(f"✗ Service {service.id} routes to {path}/, which is taken by "
+                  f"{owner if owner != service.id else 'the site itself'}", file=sys.stderr)
+            sys.exit(1)
+        self.claimed.pop(self.paths.get(service.id), None)
+        self.claimed[path] = service.id
+        self.paths[service.id] = path
+        service.path = path
+        return path
+
+
+DEFAULT = Router()
+
+
+# ── redirects ──
+
+def moved(previous, current):
+    """[(service id, old path, new path)] for services whose path changed.
+    previous and current map service id → path; new and removed services are
+    not moves.
+    """
+    return [(sid, previous[sid], path) for sid, path in current.items()
+            if sid in previous and previous[sid] != path]
+
+
+def stub(target, canonical):
+    """A redirect page to target (relative, so it works from any host) whose
+    canonical link is the absolute URL canonical."""
+    href = html.escape(target)
+    return (
+        "<!doctype html>\n"
+        '<html lang="en"><head><meta charset="utf-8"><title>Moved</title>\n'
+        f'<link rel="canonical" href="{html.escape(canonical)}">\n'
+        '<meta name="robots" content="noindex">\n'
+        f'<meta http-equiv="refresh" content="0; url={href}">\n'
+        f"<script>location.replace({json.dumps(target)} + location.search + location.hash)</script>\n"
+        f'</head><body data-pagefind-ignore="all"><p>Moved to <a href="{href}">{href}</a>.</p></body></html>\n'
+    )
+
+
+def write_redirects(site_dir, redirects):
+    """Write a stub at every old page location of a moved service.
+    redirects is [(old path, new path, page URLs)]; locations that hold real
+    content in site_dir are left alone. Returns stubs written.
+    """
+    count = 0
+    for old, new, urls in redirects:
+        for url in urls:
+            rel = url + "index.html" if url == "" or url.endswith("/") else url
+            out = os.path.join(site_dir, *old.split("/"), *rel.split("/"))
+            if os.path.exists(out):
+                continue
+            target = posixpath.relpath(posixpath.join(new, url or "."), posixpath.dirname(f"{old}/{rel}"))
+            if url == "" or url.endswith("/"):
+                target += "/"
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, "w") as f:
+                f.write(stub(target, f"{BASE_URL}/{posixpath.join(new, url)}"))
+            count += 1
+    if redirects:
+        print(f"✓ Redirects written for {len(redirects)} moved path(s) ({count} stubs)")
+    return count
@@ -0,0 +1,401 @@
+"""
+Persistent metadata store for the aggregation pipeline.
+
+An embedded SQLite database at _build/docspine.db, written by aggregate.py /
+pipeline.py and queried by the generators. Unlike _build/services.json it
+survives across runs and keeps history:
+
+  repos          one row per registry repo, with the commit last built
+  services       one row per service (the services.json record plus its
+                 routed path, registry position and source repo)
+  pages          every published HTML page of a service, with title and
+                 content hash
+  build_runs     one row per pipeline run: timing and outcome
+  service_builds per-service build duration and outcome within a run
+  changes        services and pages added / modified / removed by each
+                 successful run: the live rows diffed against the published
+                 ones (page hashes come from the copy) when the run finishes
+  redirects      old paths of services that moved, kept so redirect stubs
+                 can be written there on every later build
+  published_services, published_pages
+                 the services and pages as of the last successful run
+
+Writes are upserts that only touch rows whose values changed, so an
+incremental run over a large registry rewrites little.
+
+A run writes services and pages as it goes, so generators can read the site
+being built. The published_* tables are only brought up to date when the run
+finishes successfully (finish_run). Anything that compares with the previous
+build (route_table, change detection) reads them, so a run that fails after
+writing rows never becomes the baseline for the next one, and records no
+changes. Redirects recorded by a failed run are dropped the same way.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+DB_PATH = os.path.join("_build", "docspine.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    id           INTEGER PRIMARY KEY,
+    url          TEXT NOT NULL UNIQUE,
+    branch       TEXT NOT NULL,
+    commit_sha   TEXT,
+    committed_at TEXT,
+    updated_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS services (
+    id         TEXT PRIMARY KEY,
+    repo_id    INTEGER REFERENCES repos(id) ON DELETE SET NULL,
+    docs_path  TEXT NOT NULL,
+    position   INTEGER NOT NULL,
+    name       TEXT NOT NULL,
+    domain     TEXT NOT NULL,
+    team       TEXT NOT NULL,
+    pages      INTEGER NOT NULL,
+    diataxis   TEXT NOT NULL,
+    path       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS services_domain ON services(domain, position);
+CREATE INDEX IF NOT EXISTS services_team ON services(team);
+CREATE INDEX IF NOT EXISTS services_position ON services(position);
+CREATE TABLE IF NOT EXISTS pages (
+    service_id   TEXT NOT NULL REFERENCES services(id) ON DELETE CASCADE,
+    url          TEXT NOT NULL,
+    title        TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at   REAL NOT NULL,
+    PRIMARY KEY (service_id, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pages_hash ON pages(content_hash);
+CREATE TABLE IF NOT EXISTS build_runs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at  REAL NOT NULL,
+    finished_at REAL,
+    status      TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS service_builds (
+    run_id     INTEGER NOT NULL REFERENCES build_runs(id) ON DELETE CASCADE,
+    service_id TEXT NOT NULL,
+    duration_s REAL NOT NULL,
+    outcome    TEXT NOT NULL,
+    PRIMARY KEY (run_id, service_id)
+);
+CREATE INDEX IF NOT EXISTS service_builds_service ON service_builds(service_id, run_id);
+CREATE TABLE IF NOT EXISTS changes (
+    run_id     INTEGER NOT NULL REFERENCES build_runs(id) ON DELETE CASCADE,
+    service_id TEXT NOT NULL,
+    path       TEXT NOT NULL,
+    url        TEXT,
+    change     TEXT NOT NULL,
+    title      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_run ON changes(run_id);
+CREATE TABLE IF NOT EXISTS redirects (
+    path       TEXT PRIMARY KEY,
+    service_id TEXT NOT NULL REFERENCES services(id) ON DELETE CASCADE,
+    run_id     INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS published_services (
+    id   TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS published_pages (
+    service_id   TEXT NOT NULL,
+    url          TEXT NOT NULL,
+    title        TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (service_id, url)
+) WITHOUT ROWID;
+"""
+# Stores created before the published_* tables take their live rows as the
+# last published state, once.
+SCHEMA_VERSION = 1
+
+CHANGE_HISTORY_RUNS = 100
+
+_TITLE = re.compile(rb"<title>(.*?)</title>", re.S | re.I)
+
+
+def connect(path=DB_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Concurrent runs share the database; wait out each other's write transactions.
+    conn = sqlite3.connect(path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        with conn:
+            if conn.execute("SELECT 1 FROM build_runs WHERE status = 'ok'").fetchone():
+                _promote(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def exists(path=DB_PATH):
+    return os.path.exists(path)
+
+
+# ── runs ──
+
+def start_run(conn):
+    with conn:
+        run_id = conn.execute("INSERT INTO build_runs (started_at) VALUES (?)", (time.time(),)).lastrowid
+        conn.execute("DELETE FROM changes WHERE run_id <= ?", (run_id - CHANGE_HISTORY_RUNS,))
+        return run_id
+
+
+def finish_run(conn, run_id, status):
+    """Close a run. A successful run's services and pages become the
+    published baseline, and redirects recorded by failed runs are dropped."""
+    with conn:
+        conn.execute("UPDATE build_runs SET finished_at = ?, status = ? WHERE id = ?",
+                     (time.time(), status, run_id))
+        if status == "ok":
+            conn.execute("DELETE FROM changes WHERE run_id = ?", (run_id,))
+            conn.execute(f"INSERT INTO changes {_PENDING}", {"run": run_id})
+            _promote(conn)
+            conn.execute("""
+                DELETE FROM redirects WHERE run_id NOT IN (SELECT id FROM build_runs WHERE status = 'ok')
+            """)
+
+
+# The run in progress's changes: live services and pages against published.
+_PENDING = """
+    SELECT :run AS run_id, id AS service_id, path, NULL AS url, 'added' AS change, name AS title
+    FROM services WHERE id NOT IN (SELECT id FROM published_services)
+    UNION ALL
+    SELECT :run, id, path, NULL, 'removed', name
+    FROM published_services WHERE id NOT IN (SELECT id FROM services)
+    UNION ALL
+    SELECT :run, p.service_id, s.path, p.url,
+           CASE WHEN q.url IS NULL THEN 'added' ELSE 'modified' END, p.title
+    FROM pages p JOIN services s ON s.id = p.service_id
+    LEFT JOIN published_pages q ON q.service_id = p.service_id AND q.url = p.url
+    WHERE q.url IS NULL OR q.content_hash != p.content_hash
+    UNION ALL
+    SELECT :run, q.service_id, s.path, q.url, 'removed', q.title
+    FROM published_pages q JOIN services s ON s.id = q.service_id
+    WHERE NOT EXISTS (SELECT 1 FROM pages p WHERE p.service_id = q.service_id AND p.url = q.url)
+"""
+
+
+def _promote(conn):
+    """Bring the published_* tables up to date with the live ones."""
+    conn.execute("DELETE FROM published_services WHERE id NOT IN (SELECT id FROM services)")
+    conn.execute("""
+        INSERT INTO published_services SELECT id, path, name FROM services WHERE true
+        ON CONFLICT(id) DO UPDATE SET path = excluded.path, name = excluded.name
+        WHERE (path, name) IS NOT (excluded.path, excluded.name)
+    """)
+    conn.execute("""
+        DELETE FROM published_pages WHERE NOT EXISTS (
+            SELECT 1 FROM pages p WHERE p.service_id = published_pages.service_id AND p.url = published_pages.url)
+    """)
+    conn.execute("""
+        INSERT INTO published_pages SELECT service_id, url, title, content_hash FROM pages WHERE true
+        ON CONFLICT(service_id, url) DO UPDATE SET
+            title = excluded.title, content_hash = excluded.content_hash
+        WHERE (title, content_hash) IS NOT (excluded.title, excluded.content_hash)
+    """)
+
+
+def record_build(conn, run_id, service_id, duration, outcome):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO service_builds VALUES (?, ?, ?, ?)",
+                     (run_id, service_id, duration, outcome))
+
+
+# ── repos and services ──
+
+def upsert_repo(conn, repo):
+    """Insert or update a model.Repo row; returns its id."""
+    with conn:
+        conn.execute("""
+            INSERT INTO repos (url, branch, commit_sha, committed_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                branch = excluded.branch, commit_sha = excluded.commit_sha,
+                committed_at = excluded.committed_at, updated_at = excluded.updated_at
+            WHERE (branch, commit_sha, committed_at)
+                IS NOT (excluded.branch, excluded.commit_sha, excluded.committed_at)
+        """, (repo.url, repo.branch, repo.commit_sha, repo.committed_at, time.time()))
+        return conn.execute("SELECT id FROM repos WHERE url = ?", (repo.url,)).fetchone()[0]
+
+
+def upsert_service(conn, service, repo_id, docs_path, position):
+    """Insert or update a service row; returns True if anything changed."""
+    row = (service.id, repo_id, docs_path, position, service.name, service.domain, service.team,
+           service.pages, json.dumps(list(service.diataxis)), service.path, time.time())
+    with conn:
+        cur = conn.execute("""
+            INSERT INTO services (id, repo_id, docs_path, position, name, domain, team,
+                                  pages, diataxis, path, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                repo_id = excluded.repo_id, docs_path = excluded.docs_path,
+                position = excluded.position, name = excluded.name, domain = excluded.domain,
+                team = excluded.team, pages = excluded.pages, diataxis = excluded.diataxis,
+                path = excluded.path, updated_at = excluded.updated_at
+            WHERE (repo_id, docs_path, position, name, domain, team, pages, diataxis, path)
+                IS NOT (excluded.repo_id, excluded.docs_path, excluded.position, excluded.name,
+                        excluded.domain, excluded.team, excluded.pages, excluded.diataxis,
+                        excluded.path)
+        """, row)
+        return cur.rowcount > 0
+
+
+def prune_services(conn, keep_ids):
+    """Drop services no longer in the registry (their pages go with them)."""
+    keep = list(keep_ids)
+    with conn:
+        marks = ",".join("?" * len(keep)) or "NULL"
+        return conn.execute(f"DELETE FROM services WHERE id NOT IN ({marks})", keep).rowcount
+
+
+def service_rows(conn):
+    """All service rows in registry order (see model.load_services)."""
+    return conn.execute("SELECT * FROM services ORDER BY position").fetchall()
+
+
+def route_table(conn):
+    """{service id: routed path} as of the last successful build."""
+    return {r["id"]: r["path"] for r in conn.execute("SELECT id, path FROM published_services")}
+
+
+# ── redirects ──
+
+def record_moves(conn, moves, run_id):
+    """Keep the old path of every (service id, old path, new path) move.
+    Old paths a live service now occupies stop redirecting.
+    """
+    now = time.time()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO redirects VALUES (?, ?, ?, ?)",
+                         [(old, sid, run_id, now) for sid, old, _ in moves])
+        conn.execute("DELETE FROM redirects WHERE path IN (SELECT path FROM services)")
+
+
+def redirect_rows(conn, run_id=None):
+    """[(old path, current path, page URLs)] for every redirect recorded by a
+    successful run or by run_id (the run in progress)."""
+    rows = conn.execute("""
+        SELECT r.path AS old, s.path AS new, s.id FROM redirects r
+        JOIN services s ON s.id = r.service_id
+        WHERE r.run_id = ? OR r.run_id IN (SELECT id FROM build_runs WHERE status = 'ok')
+        ORDER BY r.path
+    """, (run_id,)).fetchall()
+    return [(r["old"], r["new"], [url for url, _ in service_pages(conn, r["id"])]) for r in rows]
+
+
+# ── pages ──
+
+def is_page(rel):
+    """Whether a service-relative path is a page the store tracks."""
+    return rel.endswith(".html") and os.path.basename(rel) != "404.html"
+
+
+def page_entry(rel, data):
+    """(url, title, sha256) of a page from its service-relative path and bytes."""
+    m = _TITLE.search(data, 0, 8192)
+    url = rel[: -len("index.html")] if rel.endswith("index.html") else rel
+    title = m.group(1).decode("utf-8", "replace").strip() if m else url or "Home"
+    return url, " ".join(title.split()), hashlib.sha256(data).hexdigest()
+
+
+def scan_pages(service_dir):
+    """Return [(url, title, sha256)] for the HTML pages a service published.
+    The pipeline gets these from the copy itself (aggregate.copy_output /
+    sync_tree); this pass is for tools reading a dist/ they did not copy."""
+    pages = []
+    for root, dirs, files in os.walk(service_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, service_dir).replace(os.sep, "/")
+            if not is_page(rel):
+                continue
+            with open(path, "rb") as f:
+                pages.append(page_entry(rel, f.read()))
+    return pages
+
+
+def sync_pages(conn, service_id, pages):
+    """Upsert a service's pages, deleting ones that disappeared.
+    Returns (added, changed, removed) counts against the live rows.
+    """
+    now = time.time()
+    with conn:
+        existing = {r["url"]: (r["content_hash"], r["title"]) for r in
+                    conn.execute("SELECT url, content_hash, title FROM pages WHERE service_id = ?", (service_id,))}
+        current = {url for url, _, _ in pages}
+        added = changed = 0
+        for url, title, digest in pages:
+            if url not in existing:
+                added += 1
+            elif existing[url][0] != digest:
+                changed += 1
+            else:
+                continue
+            conn.execute("""
+                INSERT INTO pages VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(service_id, url) DO UPDATE SET
+                    title = excluded.title, content_hash = excluded.content_hash,
+                    updated_at = excluded.updated_at
+            """, (service_id, url, title, digest, now))
+        gone = [url for url in existing if url not in current]
+        conn.executemany("DELETE FROM pages WHERE service_id = ? AND url = ?",
+                         [(service_id, url) for url in gone])
+    return added, changed, len(gone)
+
+
+def iter_published_pages(conn):
+    """Yield (service path, page URL, repo commit date) for every page, in
+    registry order, straight off the cursor."""
+    yield from conn.execute("""
+        SELECT s.path, p.url, r.committed_at
+        FROM services s
+        JOIN pages p ON p.service_id = s.id
+        LEFT JOIN repos r ON r.id = s.repo_id
+        ORDER BY s.position, p.url
+    """)
+
+
+def pending_changes(conn, run_id):
+    """Change rows the run in progress would record if it finished now,
+    ordered like run_changes."""
+    return conn.execute(f"SELECT * FROM ({_PENDING}) ORDER BY url IS NOT NULL, path, url",
+                        {"run": run_id}).fetchall()
+
+
+def run_changes(conn, run_id):
+    """Change rows of a finished run, services first, then pages by service and URL."""
+    return conn.execute("""
+        SELECT * FROM changes WHERE run_id = ?
+        ORDER BY url IS NOT NULL, path, url
+    """, (run_id,)).fetchall()
+
+
+def runs_with_changes(conn, limit):
+    """[(run id, started_at, change count)] for the latest successful runs
+    that changed something."""
+    return conn.execute("""
+        SELECT r.id, r.started_at, COUNT(*) AS n FROM build_runs r
+        JOIN changes c ON c.run_id = r.id
+        WHERE r.status = 'ok'
+        GROUP BY r.id ORDER BY r.id DESC LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def service_pages(conn, service_id):
+    """[(url, title)] for a service, ordered by URL."""
+    return [(r["url"], r["title"]) for r in
+            conn.execute("SELECT url, title FROM pages WHERE service_id = ? ORDER BY url", (service_id,))]
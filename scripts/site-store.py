@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store of assembled sites, for rollbacks and reproducing a
+past dist/ without running any builds.
+
+  save     Snapshot dist/ into _build/store/. File contents go to
+           objects/<hh>/<sha256> once, however many sites share them; each
+           service's output is recorded as a tree object (path → sha256), so
+           an unchanged service costs one tree reference per site. The site
+           itself is a small manifest in sites/<id>.json.
+  list     Show stored sites, newest first.
+  restore  Materialize a stored site into a directory and verify it.
+  gc       Keep the newest N sites and delete objects no kept site references.
+
+pipeline.py saves every successful build (stage "store").
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import model
+import servicedb
+import workspace
+
+DIST_DIR = "dist"
+STORE_DIR = os.path.join("_build", "store")
+KEEP = 10
+
+
+def _object_path(store, digest):
+    return os.path.join(store, "objects", digest[:2], digest)
+
+
+def _put_bytes(store, data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = _object_path(store, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+
+def _put_file(store, path):
+    with open(path, "rb") as f:
+        return _put_bytes(store, f.read())
+
+
+def _get_json(store, digest):
+    with open(_object_path(store, digest)) as f:
+        return json.load(f)
+
+
+def service_prefixes():
+    """Routed service paths from the metadata store or services.json."""
+    if not (servicedb.exists() or os.path.exists(model.SERVICES_JSON)):
+        return []
+    return sorted({svc.path for svc in model.load_services()}, key=len, reverse=True)
+
+
+def save_site(site_dir=DIST_DIR, store=STORE_DIR, prefixes=None, label=""):
+    """Store site_dir and return the new site id."""
+    prefixes = service_prefixes() if prefixes is None else prefixes
+    trees, files = {}, {}
+    stored_before = _count_objects(store)
+    for root, dirs, names in os.walk(site_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, site_dir).replace(os.sep, "/")
+            owner = next((p for p in prefixes if rel.startswith(p + "/")), None)
+            digest = _put_file(store, path)
+            if owner:
+                trees.setdefault(owner, {})[rel[len(owner) + 1:]] = digest
+            else:
+                files[rel] = digest
+
+    manifest = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "label": label,
+        "trees": {p: _put_bytes(store, json.dumps(t, sort_keys=True).encode()) for p, t in sorted(trees.items())},
+        "files": files,
+    }
+    body = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    site_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + hashlib.sha256(body).hexdigest()[:8]
+    os.makedirs(os.path.join(store, "sites"), exist_ok=True)
+    with open(os.path.join(store, "sites", f"{site_id}.json"), "wb") as f:
+        f.write(body)
+
+    total = len(files) + sum(len(t) for t in trees.values())
+    print(f"✓ Stored site {site_id} ({total} files, {len(trees)} service trees, "
+          f"{_count_objects(store) - stored_before} new objects)")
+    return site_id
+
+
+def _count_objects(store):
+    objects = os.path.join(store, "objects")
+    if not os.path.isdir(objects):
+        return 0
+    return sum(len(os.listdir(os.path.join(objects, d))) for d in os.listdir(objects))
+
+
+def list_sites(store=STORE_DIR):
+    """Stored site ids, newest first."""
+    sites = os.path.join(store, "sites")
+    if not os.path.isdir(sites):
+        return []
+    return sorted((n[:-5] for n in os.listdir(sites) if n.endswith(".json")), reverse=True)
+
+
+def load_site(store, site_id):
+    """Flatten a stored site into {relative path: sha256}."""
+    matches = [s for s in list_sites(store) if s == site_id or s.startswith(site_id)]
+    if len(matches) != 1:
+        print(f"✗ {'No' if not matches else 'Ambiguous'} stored site matching {site_id!r}", file=sys.stderr)
+        sys.exit(1)
+    with open(os.path.join(store, "sites", f"{matches[0]}.json")) as f:
+        manifest = json.load(f)
+    files = dict(manifest["files"])
+    for prefix, tree in manifest["trees"].items():
+        files.update({f"{prefix}/{rel}": digest for rel, digest in _get_json(store, tree).items()})
+    return matches[0], files
+
+
+def restore_site(site_id, out, store=STORE_DIR):
+    """Materialize a stored site beside `out`, verify it, then swap it into place."""
+    site_id, files = load_site(store, site_id)
+    staging = workspace.staging_dir(out, f"restore-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    bad = []
+    for rel, digest in sorted(files.items()):
+        dst = os.path.join(staging, *rel.split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(_object_path(store, digest), dst)
+        with open(dst, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != digest:
+                bad.append(rel)
+    if bad:
+        for rel in bad[:20]:
+            print(f"  ✗ {rel}", file=sys.stderr)
+        print(f"✗ {len(bad)} file(s) failed verification; the store is corrupt", file=sys.stderr)
+        shutil.rmtree(staging)
+        sys.exit(1)
+    with workspace.lock("dist"):
+        workspace.swap_dir(staging, out)
+    print(f"✓ Restored site {site_id} to {out}/ ({len(files)} files verified)")
+
+
+def gc(store=STORE_DIR, keep=KEEP):
+    """Drop all but the newest `keep` sites, then sweep unreferenced objects."""
+    sites = list_sites(store)
+    for site_id in sites[keep:]:
+        os.remove(os.path.join(store, "sites", f"{site_id}.json"))
+
+    live = set()
+    for site_id in sites[:keep]:
+        with open(os.path.join(store, "sites", f"{site_id}.json")) as f:
+            manifest = json.load(f)
+        live.update(manifest["files"].values())
+        for tree in manifest["trees"].values():
+            live.add(tree)
+            live.update(_get_json(store, tree).values())
+
+    removed = freed = 0
+    objects = os.path.join(store, "objects")
+    for shard in os.listdir(objects) if os.path.isdir(objects) else []:
+        for name in os.listdir(os.path.join(objects, shard)):
+            if name not in live:
+                path = os.path.join(objects, shard, name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+    print(f"✓ Store GC: kept {min(len(sites), keep)} site(s), dropped {max(len(sites) - keep, 0)}, "
+          f"removed {removed} object(s) ({freed / 1024:.0f} KiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store and restore assembled sites by content hash.")
+    parser.add_argument("--store", default=STORE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    save = sub.add_parser("save", help="snapshot the assembled site")
+    save.add_argument("--site", default=DIST_DIR)
+    save.add_argument("--label", default="", help="free-form note, e.g. a commit sha")
+    save.add_argument("--keep", type=int, default=KEEP, help=f"sites to keep after saving (default: {KEEP})")
+
+    sub.add_parser("list", help="list stored sites, newest first")
+
+    restore = sub.add_parser("restore", help="materialize a stored site")
+    restore.add_argument("site_id", help="site id or unique prefix")
+    restore.add_argument("--out", required=True)
+
+    collect = sub.add_parser("gc", help="drop old sites and unreferenced objects")
+    collect.add_argument("--keep", type=int, default=KEEP)
+
+    args = parser.parse_args()
+    if args.command == "save":
+        with workspace.lock("store"):
+            save_site(args.site, args.store, label=args.label)
+            gc(args.store, args.keep)
+    elif args.command == "list":
+        for site_id in list_sites(args.store):
+            with open(os.path.join(args.store, "sites", f"{site_id}.json")) as f:
+                manifest = json.load(f)
+            files = len(manifest["files"])
+            print(f"  {site_id}  {manifest['created']}  {len(manifest['trees'])} services, "
+                  f"{files} top-level files  {manifest.get('label', '')}")
+    elif args.command == "restore":
+        restore_site(args.site_id, args.out, args.store)
+    else:
+        with workspace.lock("store"):
+            gc(args.store, args.keep)
+
+
+if __name__ == "__main__":
+    main()
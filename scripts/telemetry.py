@@ -0,0 +1,173 @@
+"""
+Structured logs and metrics for pipeline runs.
+
+Events go to _build/logs/run-<id>.jsonl as one JSON object per line, tagged
+with the run id and whatever repo / service ids the caller passes, e.g.
+
+  {"ts": "...", "run": 42, "event": "build", "service": "checkout-api",
+   "outcome": "ok", "duration_s": 3.1}
+
+With echo on (pipeline.py --log-format json) the same lines are written to
+stderr, for log shippers that read the process output.
+
+Metrics are kept in process and written with write_metrics() in Prometheus
+text exposition format to _build/metrics.prom, for a node-exporter textfile
+collector or any scraper that reads files. The file is replaced atomically.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+BUILD_DIR = "_build"
+LOG_DIR = os.path.join(BUILD_DIR, "logs")
+METRICS_FILE = os.path.join(BUILD_DIR, "metrics.prom")
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+KEEP_LOGS = 100
+
+_lock = threading.Lock()
+_context = {"run": None}
+_log_file = None
+_echo = False
+_metrics = {}  # name → Counter | Gauge | Histogram
+
+
+def configure(run_id, log_dir=LOG_DIR, echo=False):
+    """Start logging for a run; later log() calls carry its id."""
+    global _log_file, _echo
+    os.makedirs(log_dir, exist_ok=True)
+    old = sorted((f for f in os.listdir(log_dir) if f.startswith("run-")),
+                 key=lambda f: os.path.getmtime(os.path.join(log_dir, f)))
+    for name in old[:-KEEP_LOGS]:
+        os.remove(os.path.join(log_dir, name))
+    _context["run"] = run_id
+    _echo = echo
+    _log_file = open(os.path.join(log_dir, f"run-{run_id}.jsonl"), "a", encoding="utf-8")
+
+
+def log(event, **fields):
+    record = {"ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), **_context, "event": event}
+    record.update((k, v) for k, v in fields.items() if v is not None)
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        if _log_file:
+            _log_file.write(line)
+            _log_file.flush()
+        if _echo:
+            sys.stderr.write(line)
+
+
+def close():
+    global _log_file
+    if _log_file:
+        _log_file.close()
+        _log_file = None
+
+
+# ── metrics ──
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(dict(key))} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self.series = {}  # labels → [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        for key, series in sorted(self.series.items()):
+            labels = dict(key)
+            for bound, n in zip(self.buckets, series):
+                yield f"{self.name}_bucket{_labels({**labels, 'le': bound})} {n}"
+            yield f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {series[-1]}"
+            yield f"{self.name}_sum{_labels(labels)} {series[-2]}"
+            yield f"{self.name}_count{_labels(labels)} {series[-1]}"
+
+
+def _metric(cls, name, help_text):
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = cls(name, help_text)
+        return _metrics[name]
+
+
+def counter(name, help_text=""):
+    return _metric(Counter, name, help_text)
+
+
+def gauge(name, help_text=""):
+    return _metric(Gauge, name, help_text)
+
+
+def histogram(name, help_text=""):
+    return _metric(Histogram, name, help_text)
+
+
+def write_metrics(path=METRICS_FILE):
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        lines.extend(metric.samples())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+CLONE_BYTES = counter("docspine_clone_bytes_total", "Bytes on disk after cloning each repo.")
+BUILD_SECONDS = histogram("docspine_build_duration_seconds", "Service docs build duration.")
+COPIED_FILES = counter("docspine_copied_files_total", "Files copied or synced into the site.")
+COPIED_BYTES = counter("docspine_copied_bytes_total", "Bytes copied or synced into the site.")
+CACHE_HITS = counter("docspine_cache_hits_total", "Cache hits per cache.")
+CACHE_MISSES = counter("docspine_cache_misses_total", "Cache misses per cache.")
+FAILURES = counter("docspine_failures_total", "Failures per stage.")
+STAGE_SECONDS = gauge("docspine_stage_duration_seconds", "Wall time spent in each pipeline stage.")
+SERVICES = gauge("docspine_services", "Services in the assembled site.")
+LAST_RUN = gauge("docspine_last_run_timestamp_seconds", "Unix time the last run finished, per status.")
@@ -0,0 +1,139 @@
+"""
+Recursive file watcher for pipeline.py --watch.
+
+Uses Linux inotify through ctypes (no extra dependency) and falls back to
+polling mtimes elsewhere. Directories named in `ignore` (build output, .git)
+are not watched, so rebuilding a service doesn't trigger itself.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_IGNORE = {".git", "__pycache__", "node_modules", ".cache"}
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class TreeWatcher:
+    """Watch directory trees and report changed file paths in debounced batches."""
+
+    def __init__(self, roots, ignore=(), poll_interval=1.0):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.ignore = {os.path.abspath(p) for p in ignore}
+        self.poll_interval = poll_interval
+        self.libc = _libc() if os.name == "posix" else None
+        self.fd = -1
+        self.wds = {}
+        if self.libc:
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self.fd < 0:
+                self.libc = None
+        if self.libc:
+            for root in self.roots:
+                self._watch_tree(root)
+        else:
+            self.snapshot = self._scan()
+
+    @property
+    def mode(self):
+        return "inotify" if self.libc else "polling"
+
+    def _skip(self, path):
+        return os.path.basename(path) in DEFAULT_IGNORE or path in self.ignore
+
+    def _walk_dirs(self, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not self._skip(os.path.join(dirpath, d))]
+            yield dirpath
+
+    def _watch_tree(self, root):
+        for path in self._walk_dirs(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd >= 0:
+                self.wds[wd] = path
+
+    def _scan(self):
+        state = {}
+        for root in self.roots:
+            for dirpath in self._walk_dirs(root):
+                for name in os.listdir(dirpath):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if not os.path.isdir(path):
+                        state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                base = self.wds.get(wd)
+                if base is None:
+                    continue
+                path = os.path.join(base, name) if name else base
+                if mask & IN_DELETE_SELF:
+                    self.wds.pop(wd, None)
+                elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not self._skip(path):
+                    self._watch_tree(path)
+                if not self._skip(path):
+                    changed.add(path)
+
+    def wait(self, debounce=0.3):
+        """Block until something changes, then return the set of changed paths.
+        Events arriving within `debounce` seconds of each other are batched.
+        """
+        if not self.libc:
+            while True:
+                time.sleep(self.poll_interval)
+                current = self._scan()
+                changed = {p for p in current.keys() | self.snapshot.keys()
+                           if current.get(p) != self.snapshot.get(p)}
+                self.snapshot = current
+                if changed:
+                    return changed
+
+        changed = set()
+        select.select([self.fd], [], [])
+        while True:
+            changed |= self._read_events()
+            ready, _, _ = select.select([self.fd], [], [], debounce)
+            if not ready:
+                return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,134 @@
+"""
+Per-run workspaces and locks, so concurrent pipeline runs (or a run next to
+pipeline.py --watch) don't trample each other.
+
+Each run clones into its own _build/runs/<id>/ and assembles the site in a
+staging directory beside dist/ (.dist-<id>). publish() then swaps the staging
+tree into place in one rename: renameat2(RENAME_EXCHANGE) on Linux, two quick
+renames elsewhere. A preview server keeps serving the old site until the swap
+and the new one from the next request on, never a half-written tree.
+
+Shared state under _build/ (link-check cache, site store, dist/ itself) is
+guarded with flock(2) lock files in _build/locks/. Run directories left behind
+by crashed runs are removed by the next run once their lock is free.
+"""
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: runs are still isolated, just not locked
+    fcntl = None
+
+BUILD_DIR = "_build"
+DIST_DIR = "dist"
+LOCKS_DIR = os.path.join(BUILD_DIR, "locks")
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+@contextlib.contextmanager
+def lock(name, locks_dir=LOCKS_DIR):
+    """Hold an exclusive lock on _build/locks/<name>.lock for the with-block."""
+    os.makedirs(locks_dir, exist_ok=True)
+    fd = os.open(os.path.join(locks_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _try_lock(path):
+    """Open and non-blockingly lock path; returns the fd or None if held elsewhere."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _exchange(a, b):
+    """Atomically swap two directory entries; False if the platform can't."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    return renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0
+
+
+def swap_dir(new, target):
+    """Move the finished tree `new` to `target`, replacing whatever was there."""
+    if not os.path.exists(target):
+        os.rename(new, target)
+        return
+    if not _exchange(new, target):
+        old = f"{new}.old"
+        os.rename(target, old)
+        os.rename(new, target)
+        new = old
+    shutil.rmtree(new)
+
+
+def staging_dir(target, run_id):
+    """A sibling of target (same filesystem, so it can be renamed into place)."""
+    parent, name = os.path.split(os.path.normpath(target))
+    return os.path.join(parent, f".{name}-{run_id}")
+
+
+class Workspace:
+    """Private clone and site-staging directories for one run."""
+
+    def __init__(self, build_dir=BUILD_DIR, dist_dir=DIST_DIR):
+        self.dist_dir = dist_dir
+        self.runs_dir = os.path.join(build_dir, "runs")
+        self.locks_dir = os.path.join(build_dir, "locks")
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self.prune()
+
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.root = os.path.join(self.runs_dir, self.id)
+        os.makedirs(self.root)
+        self._fd = _try_lock(os.path.join(self.root, ".lock"))
+        self.clones = os.path.join(self.root, "clones")
+        self.dist = staging_dir(dist_dir, self.id)
+        os.makedirs(self.clones)
+        os.makedirs(self.dist)
+
+    def prune(self):
+        """Remove run directories (and their staging trees) whose run has died."""
+        for run_id in os.listdir(self.runs_dir):
+            root = os.path.join(self.runs_dir, run_id)
+            if time.time() - os.path.getmtime(root) < 60:
+                continue  # may be a run still taking its lock
+            fd = _try_lock(os.path.join(root, ".lock"))
+            if fd is None:
+                continue
+            try:
+                shutil.rmtree(staging_dir(self.dist_dir, run_id), ignore_errors=True)
+                shutil.rmtree(root, ignore_errors=True)
+            finally:
+                os.close(fd)
+
+    def publish(self):
+        """Swap the staged site into dist/."""
+        with lock("dist", self.locks_dir):
+            swap_dir(self.dist, self.dist_dir)
+        print(f"✓ Published {self.dist_dir}/")
+
+    def close(self):
+        shutil.rmtree(self.dist, ignore_errors=True)
+        shutil.rmtree(self.root, ignore_errors=True)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
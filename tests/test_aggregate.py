@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import aggregate  # noqa: E402
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+class SparsePathsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.origin = os.path.join(self.tmp.name, "origin")
+        files = {
+            "services/api/docspine.yaml": "service: api\n",
+            "theme/main.html": "<html></html>\n",
+            "snippets/api/auth.md": "auth\n",
+            "mkdocs.base.yml": "theme: material\n",
+            "other/big.bin": "x\n",
+        }
+        for rel, text in files.items():
+            path = os.path.join(self.origin, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+        git("init", "-q", "-b", "main", cwd=self.origin)
+        git("add", ".", cwd=self.origin)
+        git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "init", cwd=self.origin)
+        git("config", "uploadpack.allowFilter", "true", cwd=self.origin)
+        self.dest = os.path.join(self.tmp.name, "clone")
+        aggregate.clone_repo(f"file://{self.origin}", "main", self.dest, ["services/api"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_file_and_directory_entries(self):
+        aggregate.add_sparse_paths(self.dest, ["theme", "mkdocs.base.yml", "snippets/api/auth.md"])
+        for rel in ("theme/main.html", "mkdocs.base.yml", "snippets/api/auth.md"):
+            self.assertTrue(os.path.exists(os.path.join(self.dest, rel)), rel)
+        self.assertFalse(os.path.exists(os.path.join(self.dest, "other")))
+
+    def test_missing_entry_is_skipped(self):
+        aggregate.add_sparse_paths(self.dest, ["no/such/theme"])
+        self.assertTrue(os.path.exists(os.path.join(self.dest, "services/api/docspine.yaml")))
+
+
+if __name__ == "__main__":
+    unittest.main()